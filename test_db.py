@@ -1,71 +1,350 @@
-import os
+import json
+import queue
 import sqlite3
-from datetime import datetime
-
-# Import database functions from whisper_webui.py
-from whisper_webui import get_db_path, save_transcription, get_transcription_history, get_transcription_by_id, toggle_favorite, delete_transcription
-
-def test_database_functionality():
-    """Test the database functionality end-to-end."""
-    print("Testing database functionality...")
-    
-    # 1. Get database path
-    db_path = get_db_path()
-    print(f"Database path: {db_path}")
-    
-    # 2. Check if database exists
-    if os.path.exists(db_path):
-        print("Database file exists.")
-    else:
-        print("Database file does not exist!")
-        return
-    
-    # 3. Add a test transcription
-    test_transcript = "This is a test transcription to verify database functionality."
-    transcription_id = save_transcription(
-        source_name="test_file.mp3",
+import threading
+from types import SimpleNamespace
+from concurrent.futures import Future
+
+import pytest
+
+import whisper_webui
+from whisper_webui import init_db, save_transcription, save_transcriptions_bulk, get_transcription_history, get_transcription_by_id, toggle_favorite, delete_transcription, export_transcriptions_to_json
+from whisper_webui import get_cached_transcript, cache_transcript, clear_transcript_cache, find_transcript_by_hash
+from whisper_webui import merge_overlapping_transcripts, KeyPool, retry_after_seconds
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """An initialized in-memory database shared by every helper call in a test."""
+    # Guard against any helper falling back to the on-disk database
+    monkeypatch.setattr(whisper_webui, "get_db_path", lambda: ":memory:")
+
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    init_db(conn=conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def writer_db(tmp_path, monkeypatch):
+    """A connection to an initialized on-disk database, with a writer thread of its own serving queued writes."""
+    db_path = str(tmp_path / "history.db")
+    monkeypatch.setattr(whisper_webui, "get_db_path", lambda: db_path)
+    setup = sqlite3.connect(db_path, isolation_level=None)
+    init_db(conn=setup)
+
+    # Stand in for the process-wide writer, so no later test inherits a writer bound to this database
+    jobs = queue.Queue()
+    writer = threading.Thread(target=whisper_webui._writer_loop, args=(jobs,), daemon=True)
+    writer.start()
+    monkeypatch.setattr(whisper_webui, "start_db_writer", lambda: (writer, jobs))
+    yield setup
+
+    jobs.put(None)
+    writer.join(timeout=5)
+    setup.close()
+
+
+def add_test_transcription(conn, source_name="test_file.mp3"):
+    return save_transcription(
+        source_name=source_name,
         source_type="test",
         api_used="test",
         language="en",
         duration=60.0,
-        transcript=test_transcript
+        transcript="This is a test transcription to verify database functionality.",
+        conn=conn
+    ).result()
+
+
+def test_save_transcription_returns_id(conn):
+    transcription_id = add_test_transcription(conn)
+
+    assert transcription_id is not None
+
+
+def test_save_transcriptions_bulk(conn):
+    save_transcriptions_bulk([
+        ("clip.mp3", "local", "OpenAI", "en", 5.0, "first transcript"),
+        ("clip.mp3", "local", "Groq", "en", 5.0, "second transcript"),
+    ], conn=conn)
+
+    history = get_transcription_history(limit=10, conn=conn)
+
+    assert sorted(row[4] for row in history) == ["Groq", "OpenAI"]
+    assert len(get_transcription_history(search_term="second", conn=conn)) == 1
+
+
+def test_history_returns_saved_transcription(conn):
+    transcription_id = add_test_transcription(conn)
+
+    history = get_transcription_history(limit=10, conn=conn)
+
+    assert len(history) == 1
+    latest = history[0]
+    assert latest[0] == transcription_id
+    assert latest[2] == "test_file.mp3"
+    assert latest[4] == "test"
+
+
+def test_history_search_matches_source_and_transcript(conn):
+    add_test_transcription(conn, source_name="interview.mp3")
+    add_test_transcription(conn, source_name="podcast.mp3")
+
+    assert [row[2] for row in get_transcription_history(search_term="interview", conn=conn)] == ["interview.mp3"]
+    assert len(get_transcription_history(search_term="verify database", conn=conn)) == 2
+
+
+def test_history_search_matches_word_prefixes_and_ignores_operators(conn):
+    transcription_id = add_test_transcription(conn, source_name="interview.mp3")
+
+    assert [row[0] for row in get_transcription_history(search_term="interv", conn=conn)] == [transcription_id]
+    assert [row[0] for row in get_transcription_history(search_term='(test) verif*"', conn=conn)] == [transcription_id]
+    assert get_transcription_history(search_term="podcast", conn=conn) == []
+
+    delete_transcription(transcription_id, conn=conn)
+    assert get_transcription_history(search_term="interv", conn=conn) == []
+
+
+def test_get_transcription_by_id(conn):
+    transcription_id = add_test_transcription(conn)
+
+    transcription = get_transcription_by_id(transcription_id, conn=conn)
+
+    assert transcription[0] == transcription_id
+    assert transcription[7].startswith("This is a test transcription")
+    assert not transcription[8]
+
+
+def test_toggle_favorite(conn):
+    transcription_id = add_test_transcription(conn)
+
+    toggle_favorite(transcription_id, True, conn=conn)
+    assert bool(get_transcription_by_id(transcription_id, conn=conn)[8])
+
+    toggle_favorite(transcription_id, False, conn=conn)
+    assert not bool(get_transcription_by_id(transcription_id, conn=conn)[8])
+
+
+def test_delete_transcription(conn):
+    transcription_id = add_test_transcription(conn)
+
+    delete_transcription(transcription_id, conn=conn)
+
+    assert get_transcription_by_id(transcription_id, conn=conn) is None
+    assert get_transcription_history(limit=10, conn=conn) == []
+
+
+def test_export_transcriptions_to_json(conn, tmp_path):
+    export_path = tmp_path / "export.json"
+    export_transcriptions_to_json(str(export_path), conn=conn)
+    assert json.loads(export_path.read_text()) == []
+
+    first_id = add_test_transcription(conn, source_name="first.mp3")
+    second_id = add_test_transcription(conn, source_name="second.mp3")
+    export_transcriptions_to_json(str(export_path), conn=conn)
+
+    exported = json.loads(export_path.read_text())
+    assert sorted(row["id"] for row in exported) == [first_id, second_id]
+    assert exported[0]["transcript"].startswith("This is a test transcription")
+
+
+def test_transcript_cache_round_trip(conn):
+    assert get_cached_transcript("abc|OpenAI|auto", conn=conn) is None
+
+    cache_transcript("abc|OpenAI|auto", "cached text", conn=conn)
+
+    assert get_cached_transcript("abc|OpenAI|auto", conn=conn) == "cached text"
+    assert get_cached_transcript("abc|Groq|auto", conn=conn) is None
+
+    clear_transcript_cache(conn=conn)
+    assert get_cached_transcript("abc|OpenAI|auto", conn=conn) is None
+
+
+def test_transcript_cache_evicts_least_recently_used(conn, monkeypatch):
+    monkeypatch.setattr(whisper_webui, "TRANSCRIPT_CACHE_MAX_ENTRIES", 2)
+    clock = iter(range(100))
+    monkeypatch.setattr(whisper_webui.time, "time", lambda: next(clock))
+
+    cache_transcript("a", "first", conn=conn)
+    cache_transcript("b", "second", conn=conn)
+    get_cached_transcript("a", conn=conn)
+    cache_transcript("c", "third", conn=conn)
+
+    assert get_cached_transcript("a", conn=conn) == "first"
+    assert get_cached_transcript("b", conn=conn) is None
+    assert get_cached_transcript("c", conn=conn) == "third"
+
+
+def test_history_rows_carry_total_count(conn):
+    for name in ("a.mp3", "b.mp3", "c.mp3"):
+        add_test_transcription(conn, source_name=name)
+
+    page = get_transcription_history(limit=2, conn=conn)
+
+    assert len(page) == 2
+    assert page[0][-1] == 3
+
+
+def test_writes_without_connection_go_through_writer_thread(writer_db):
+    future = save_transcription("queued.mp3", "test", "test", "en", 1.0, "queued transcript")
+
+    transcription_id = future.result(timeout=5)
+    assert get_transcription_by_id(transcription_id, conn=writer_db)[2] == "queued.mp3"
+
+    cache_transcript("abc|OpenAI|auto", "queued cache entry").result(timeout=5)
+    assert get_cached_transcript("abc|OpenAI|auto", conn=writer_db) == "queued cache entry"
+    clear_transcript_cache().result(timeout=5)
+    assert get_cached_transcript("abc|OpenAI|auto", conn=writer_db) is None
+
+
+def test_writer_fails_the_batch_and_recovers_when_the_connection_cannot_open(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "history.db")
+    setup = sqlite3.connect(db_path, isolation_level=None)
+    init_db(conn=setup)
+    setup.close()
+    monkeypatch.setattr(whisper_webui, "get_db_path", lambda: str(tmp_path / "missing" / "history.db"))
+    jobs = queue.Queue()
+    writer = threading.Thread(target=whisper_webui._writer_loop, args=(jobs,), daemon=True)
+    writer.start()
+
+    failed = Future()
+    jobs.put((lambda conn: None, failed))
+    with pytest.raises(sqlite3.OperationalError):
+        failed.result(timeout=5)
+
+    monkeypatch.setattr(whisper_webui, "get_db_path", lambda: db_path)
+    saved = Future()
+    jobs.put((lambda conn: conn.execute("DELETE FROM transcript_cache").rowcount, saved))
+    assert saved.result(timeout=5) == 0
+
+    jobs.put(None)
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+
+
+def test_reads_borrow_pooled_connections(tmp_path, monkeypatch):
+    monkeypatch.setattr(whisper_webui, "get_db_path", lambda: str(tmp_path / "history.db"))
+    # cache_resource doesn't cache outside a Streamlit runtime, so pin the pool for the test
+    pool = queue.LifoQueue(maxsize=1)
+    monkeypatch.setattr(whisper_webui, "get_db_pool", lambda: pool)
+
+    with whisper_webui.db_read() as first:
+        with whisper_webui.db_read() as concurrent:
+            assert concurrent is not first
+    # The pool kept the connection returned first and closed the one it had no room for
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute("SELECT 1")
+    with whisper_webui.db_read() as reused:
+        assert reused is concurrent
+
+    pool.get_nowait().close()
+
+
+def test_history_pages_and_filters_favorites_in_sql(conn):
+    ids = [add_test_transcription(conn, source_name=f"{i}.mp3") for i in range(3)]
+    toggle_favorite(ids[0], True, conn=conn)
+
+    assert len(get_transcription_history(limit=2, offset=2, conn=conn)) == 1
+    favorites = get_transcription_history(limit=2, favorites_only=True, conn=conn)
+    assert [row[0] for row in favorites] == [ids[0]]
+    assert favorites[0][-1] == 1
+
+
+def test_find_transcript_by_content_hash(conn):
+    save_transcriptions_bulk([("clip.mp3", "local", "OpenAI", "en", 5.0, "saved transcript")], content_hash="abc", conn=conn)
+
+    assert find_transcript_by_hash("abc", "OpenAI", "en", conn=conn) == "saved transcript"
+    assert find_transcript_by_hash("abc", "Groq", "en", conn=conn) is None
+    assert find_transcript_by_hash("def", "OpenAI", "en", conn=conn) is None
+
+
+def test_init_db_adds_content_hash_to_existing_table():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.execute("""
+    CREATE TABLE transcriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, source_name TEXT NOT NULL,
+        source_type TEXT NOT NULL, api_used TEXT NOT NULL, language TEXT NOT NULL,
+        duration REAL, transcript TEXT NOT NULL, favorite BOOLEAN DEFAULT 0
     )
-    print(f"Added test transcription with ID: {transcription_id}")
-    
-    # 4. Retrieve the transcription
-    history = get_transcription_history(limit=10)
-    print(f"Found {len(history)} transcriptions in history.")
-    
-    if history:
-        # Get the latest transcription
-        latest = history[0]
-        print(f"Latest transcription: ID={latest[0]}, Source={latest[2]}, API={latest[4]}")
-        
-        # 5. Get by ID
-        transcription = get_transcription_by_id(latest[0])
-        if transcription:
-            print(f"Retrieved transcription by ID: {transcription[0]}")
-            print(f"Transcript: {transcription[7][:50]}...")
-        else:
-            print("Failed to retrieve transcription by ID!")
-        
-        # 6. Toggle favorite
-        toggle_favorite(latest[0], True)
-        print(f"Marked transcription {latest[0]} as favorite.")
-        
-        # 7. Verify favorite status
-        transcription = get_transcription_by_id(latest[0])
-        print(f"Favorite status: {bool(transcription[8])}")
-        
-        # 8. Delete the test transcription
-        delete_transcription(latest[0])
-        print(f"Deleted transcription {latest[0]}.")
-        
-        # 9. Verify deletion
-        remaining = get_transcription_history(limit=10)
-        print(f"Remaining transcriptions: {len(remaining)}")
-    
-    print("Database test completed.")
-
-if __name__ == "__main__":
-    test_database_functionality() 
\ No newline at end of file
+    """)
+
+    init_db(conn=conn)
+
+    assert "content_hash" in {column[1] for column in conn.execute("PRAGMA table_info(transcriptions)")}
+    conn.close()
+
+
+def test_writer_batch_keeps_other_writes_when_one_fails(conn):
+    def insert(source_name):
+        return lambda conn: conn.execute(
+            "INSERT INTO transcriptions (timestamp, source_name, source_type, api_used, language, transcript) "
+            "VALUES ('2024-01-01 00:00:00', ?, 'test', 'test', 'en', 'batched')", (source_name,)
+        ).lastrowid
+
+    def fail(conn):
+        raise sqlite3.IntegrityError("broken write")
+
+    futures = [Future(), Future(), Future()]
+    for future in futures:
+        future.set_running_or_notify_cancel()
+    whisper_webui._commit_batch(conn, list(zip([insert("first.mp3"), fail, insert("second.mp3")], futures)))
+
+    assert isinstance(futures[1].exception(), sqlite3.IntegrityError)
+    assert sorted(row[2] for row in get_transcription_history(conn=conn)) == ["first.mp3", "second.mp3"]
+    assert get_transcription_by_id(futures[2].result(), conn=conn)[2] == "second.mp3"
+
+
+def test_merge_drops_words_repeated_across_the_overlap():
+    merged = merge_overlapping_transcripts(["we walked to the old mill.", "The old mill was closed"])
+
+    assert merged == "we walked to the old mill. was closed"
+
+
+def test_merge_keeps_a_single_repeated_boundary_word():
+    assert merge_overlapping_transcripts(["the end of the", "the beginning"]) == "the end of the the beginning"
+
+
+def test_merge_joins_chunks_without_overlap():
+    assert merge_overlapping_transcripts(["first part", "second part", ""]) == "first part second part"
+
+
+def test_retry_after_seconds_reads_capped_numeric_header():
+    assert retry_after_seconds(SimpleNamespace(headers={"retry-after": "5"}), default=1) == 5
+    assert retry_after_seconds(SimpleNamespace(headers={"retry-after": "600"}), default=1) == 60
+    assert retry_after_seconds(SimpleNamespace(headers={"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}), default=1) == 1
+    assert retry_after_seconds(SimpleNamespace(headers={}), default=2) == 2
+    assert retry_after_seconds(None, default=3) == 3
+
+
+def test_key_pool_halves_cap_on_rate_limit_and_grows_only_on_success():
+    pool = KeyPool(["a"], max_concurrency=4)
+
+    pool.release(pool.acquire(), retry_after=0)
+    assert pool._caps["a"] == 2
+    pool.release(pool.acquire(), succeeded=False)
+    assert pool._caps["a"] == 2
+    pool.release(pool.acquire())
+    assert pool._caps["a"] == 3
+
+
+def test_key_pool_rotates_away_from_a_key_cooling_down(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(whisper_webui.time, "monotonic", lambda: clock[0])
+    pool = KeyPool(["a", "b"], max_concurrency=2)
+
+    first = pool.acquire()
+    pool.release(first, retry_after=30)
+    other = "b" if first == "a" else "a"
+    assert [pool.acquire(), pool.acquire()] == [other, other]
+
+    pool.release(other)
+    clock[0] += 30
+    assert pool.acquire() == first
+
+
+def test_key_pool_hands_out_the_least_loaded_key():
+    pool = KeyPool(["a", "b"], max_concurrency=2)
+
+    assert {pool.acquire(), pool.acquire()} == {"a", "b"}
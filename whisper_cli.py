@@ -1,183 +1,382 @@
 import argparse
+import asyncio
+import json
+import logging
 import os
+import random
+import shutil
+import sys
 import time
-from pydub import AudioSegment
-from openai import OpenAI
-from groq import Groq
-import pyperclip
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 
-def get_audio_info(input_file):
-    print(f"Loading audio file: {input_file}")
-    audio = AudioSegment.from_file(input_file)
-    duration = len(audio) / 1000  # Duration in seconds
-    print(f"Audio duration: {duration:.2f} seconds")
-    return duration
+log = logging.getLogger("whisper_cli")
 
-def calculate_bitrate(input_file, target_size):
-    duration = get_audio_info(input_file)
+# Upper bound on transcription requests in flight at once
+MAX_CONCURRENT_TRANSCRIPTIONS = 8
+# ffmpeg extraction/compression is CPU-bound, so leave half the cores for ffmpeg's own threads
+MAX_PREPARE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Bitrate used for audio extracted from short videos (ffmpeg's own MP3 default)
+MAX_EXTRACT_BITRATE = 128
+# Extra attempts when a provider answers 429, with exponential backoff between them
+MAX_RATE_LIMIT_RETRIES = 3
+# Oversized audio is split into segments of at most this length and size instead of being re-encoded
+MAX_SEGMENT_SECONDS = 600
+SEGMENT_TARGET_MB = 24
+# Segment extensions for inputs whose own extension has no ffmpeg muxer; the rest keep theirs
+_SEGMENT_EXTS = {'.mpga': '.mp3'}
+
+_AUDIO_EXTS = frozenset({'.mp3', '.mp4', '.mpeg', '.mpga', '.m4a', '.wav', '.webm'})
+_VIDEO_EXTS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm'})
+_MEDIA_EXTS = _AUDIO_EXTS | _VIDEO_EXTS
+
+# API clients are created on first use and shared, so every file reuses the same connection pool.
+# The SDKs are imported there too, so --help and single-provider runs skip the other's import cost.
+_openai_client = None
+_groq_client = None
+
+# Each gets an explicit httpx client: the pinned groq SDK passes `proxies` to httpx's own
+# constructor, which httpx 0.28 no longer accepts. SDK retries are off, so 429s are only
+# retried by create_transcription.
+def _get_openai_client():
+    global _openai_client
+    import httpx
+    from openai import AsyncOpenAI
+    _openai_client = _openai_client or AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"], http_client=httpx.AsyncClient(), max_retries=0)
+    return _openai_client
+
+def _get_groq_client():
+    global _groq_client
+    import httpx
+    from groq import AsyncGroq
+    _groq_client = _groq_client or AsyncGroq(api_key=os.environ["GROQ_API_KEY"], http_client=httpx.AsyncClient(), max_retries=0)
+    return _groq_client
+
+@contextmanager
+def timed(label):
+    """Log how long the wrapped block took, using the monotonic perf counter"""
+    start = time.perf_counter_ns()
+    yield
+    log.info("%s completed in %.2f seconds.", label, (time.perf_counter_ns() - start) / 1e9)
+
+def run_media_command(cmd):
+    """Run an ffmpeg/ffprobe command and return its stdout as bytes
+    
+    Both pipes are drained by communicate() through 1MB buffers, so a chatty
+    stderr can never fill up and deadlock the child.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, output=out, stderr=err)
+    return out
+
+@dataclass(slots=True, frozen=True)
+class MediaFile:
+    """Metadata for one input file, probed once and passed down the pipeline"""
+    path: str
+    ext: str
+    size_bytes: int
+    duration_s: float
+    is_video: bool
+
+    @property
+    def size_mb(self):
+        return self.size_bytes / (1024 * 1024)
+
+def probe_media(input_file):
+    """Build a MediaFile from a single ffprobe call and a stat, without decoding the audio"""
+    log.info("Probing media file: %s", input_file)
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', input_file]
+    info = json.loads(run_media_command(cmd))
+    _, extension = os.path.splitext(input_file)
+    media = MediaFile(
+        path=input_file,
+        ext=extension.lower(),
+        size_bytes=os.stat(input_file).st_size,
+        duration_s=float(info['format']['duration']),
+        is_video=is_video_format(input_file),
+    )
+    log.info("Media duration: %.2f seconds", media.duration_s)
+    return media
+
+def calculate_bitrate(duration, target_size):
+    """Bitrate in kbps that makes `duration` seconds of audio fit in `target_size` KB"""
     bitrate = (target_size * 8) / (1.048576 * duration)
-    print(f"Calculated bitrate: {bitrate:.2f} kbps")
+    log.info("Calculated bitrate: %.2f kbps", bitrate)
     return int(bitrate)
 
 def compress_audio(input_file, output_file, bitrate):
-    print(f"Compressing audio file: {input_file}")
-    start_time = time.time()
-    audio = AudioSegment.from_file(input_file)
-    print(f"Exporting compressed audio to: {output_file}")
-    audio.export(output_file, format='mp3', bitrate=f'{bitrate}k')
-    end_time = time.time()
-    compression_time = end_time - start_time
-    print(f"Audio compression completed in {compression_time:.2f} seconds.")
+    """Re-encode to MP3 at the given bitrate in a single streaming ffmpeg pass"""
+    log.info("Compressing audio file: %s -> %s", input_file, output_file)
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error', '-i', input_file, '-vn', '-c:a', 'libmp3lame',
+           '-b:a', f'{bitrate}k', '-threads', '0', '-y', output_file]
+    with timed("Audio compression"):
+        run_media_command(cmd)
+
+def split_audio(media):
+    """Stream-copy an oversized audio file into segments that each fit the upload limit
+    
+    No re-encoding happens, so this takes seconds and keeps the original quality.
+    Returns the temporary segment directory and the segment paths in order.
+    """
+    segment_time = max(1, min(MAX_SEGMENT_SECONDS, int(media.duration_s * SEGMENT_TARGET_MB / media.size_mb)))
+    log.info("Splitting audio file into %d second segments: %s", segment_time, media.path)
+    
+    segment_dir = tempfile.mkdtemp(prefix='whisper_segments_')
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error', '-i', media.path, '-vn', '-f', 'segment',
+           '-segment_time', str(segment_time), '-c', 'copy', '-reset_timestamps', '1',
+           os.path.join(segment_dir, f'part_%03d{_SEGMENT_EXTS.get(media.ext, media.ext)}')]
+    try:
+        run_media_command(cmd)
+    except subprocess.CalledProcessError:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        raise
+    
+    return segment_dir, sorted(os.path.join(segment_dir, name) for name in os.listdir(segment_dir))
 
 def is_valid_media_format(input_file):
-    valid_formats = [
-        # Audio formats
-        '.mp3', '.mp4', '.mpeg', '.mpga', '.m4a', '.wav', '.webm',
-        # Video formats
-        '.avi', '.mov', '.mkv', '.flv', '.wmv'
-    ]
-    _, extension = os.path.splitext(input_file)
-    return extension.lower() in valid_formats
+    return os.path.splitext(input_file)[1].lower() in _MEDIA_EXTS
 
 def is_video_format(input_file):
-    video_formats = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
-    _, extension = os.path.splitext(input_file)
-    return extension.lower() in video_formats
+    return os.path.splitext(input_file)[1].lower() in _VIDEO_EXTS
 
-def extract_audio_from_video(video_file_path, output_file=None):
-    """Extract audio track from a video file using FFmpeg"""
+def extract_and_compress(video_file_path, bitrate, output_file=None):
+    """Extract the audio track of a video and encode it at the given bitrate in one FFmpeg pass"""
     if output_file is None:
         output_file = f"{os.path.splitext(video_file_path)[0]}_audio.mp3"
     
-    print(f"Extracting audio from video: {video_file_path}")
-    start_time = time.time()
-    
-    cmd = ['ffmpeg', '-i', video_file_path, '-vn', '-acodec', 'mp3', '-y', output_file]
-    subprocess.run(cmd, check=True)
-    
-    end_time = time.time()
-    extraction_time = end_time - start_time
-    print(f"Audio extraction completed in {extraction_time:.2f} seconds.")
+    log.info("Extracting audio from video at %d kbps: %s", bitrate, video_file_path)
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error', '-i', video_file_path, '-vn', '-c:a', 'libmp3lame',
+           '-b:a', f'{bitrate}k', '-threads', '0', '-y', output_file]
+    with timed("Audio extraction"):
+        run_media_command(cmd)
     
     return output_file
 
-def transcribe_audio_openai(input_file, output_file, copy_to_clipboard):
-    print(f"Transcribing audio file using OpenAI: {input_file}")
-    
-    # Check if API key is set
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        print("Error: OPENAI_API_KEY environment variable not set.")
-        return
-    
-    client = OpenAI(api_key=api_key)
-    
-    try:
-        start_time = time.time()
-        
-        with open(input_file, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
+async def create_transcription(client, audio_file):
+    """Request a transcription, backing off and retrying while the provider is rate limiting"""
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        try:
+            audio_file.seek(0)
+            return await client.audio.transcriptions.create(
                 model="whisper-1", 
                 file=audio_file
             )
-        
-        end_time = time.time()
-        transcription_time = end_time - start_time
-        
-        print(f"Transcription completed in {transcription_time:.2f} seconds.")
-        save_transcript(transcript.text, output_file, copy_to_clipboard)
-        
-    except Exception as e:
-        print(f"Error during transcription: {str(e)}")
+        except Exception as e:
+            # Both SDKs expose the HTTP status on their APIStatusError subclasses
+            if getattr(e, 'status_code', None) != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                raise
+            delay = 2 ** attempt + random.random()
+            log.warning("Rate limited while transcribing %s, retrying in %.1f seconds...", audio_file.name, delay)
+            await asyncio.sleep(delay)
 
-def transcribe_audio_groq(input_file, output_file, copy_to_clipboard):
-    print(f"Transcribing audio file using Groq: {input_file}")
+async def transcribe_audio_openai_async(input_file, semaphore):
+    """Return the transcript text for one audio file, or None if it failed"""
+    # Check if API key is set
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        log.error("Error: OPENAI_API_KEY environment variable not set.")
+        return None
     
+    async with semaphore:
+        log.info("Transcribing audio file using OpenAI: %s", input_file)
+        try:
+            # Inside the try, so a client that can't be built fails only this provider
+            client = _get_openai_client()
+            # Large buffered reads let the SDK stream the multipart body instead of many small reads
+            with timed(f"Transcription of {input_file}"), open(input_file, "rb", buffering=1 << 20) as audio_file:
+                transcript = await create_transcription(client, audio_file)
+            
+            return transcript.text
+            
+        except Exception as e:
+            log.error("Error during transcription of %s: %s", input_file, e)
+            return None
+
+async def transcribe_audio_groq_async(input_file, semaphore):
+    """Return the transcript text for one audio file, or None if it failed"""
     # Check if API key is set
     api_key = os.environ.get("GROQ_API_KEY")
     if not api_key:
-        print("Error: GROQ_API_KEY environment variable not set.")
-        return
-    
-    client = Groq(api_key=api_key)
+        log.error("Error: GROQ_API_KEY environment variable not set.")
+        return None
     
-    try:
-        start_time = time.time()
-        
-        with open(input_file, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1", 
-                file=audio_file
-            )
-        
-        end_time = time.time()
-        transcription_time = end_time - start_time
-        
-        print(f"Transcription completed in {transcription_time:.2f} seconds.")
-        save_transcript(transcript.text, output_file, copy_to_clipboard)
-        
-    except Exception as e:
-        print(f"Error during transcription: {str(e)}")
+    async with semaphore:
+        log.info("Transcribing audio file using Groq: %s", input_file)
+        try:
+            # Inside the try, so a client that can't be built fails only this provider
+            client = _get_groq_client()
+            with timed(f"Transcription of {input_file}"), open(input_file, "rb", buffering=1 << 20) as audio_file:
+                transcript = await create_transcription(client, audio_file)
+            
+            return transcript.text
+            
+        except Exception as e:
+            log.error("Error during transcription of %s: %s", input_file, e)
+            return None
 
 def save_transcript(transcript, output_file, copy_to_clipboard):
     with open(output_file, "w") as transcript_file:
         transcript_file.write(transcript)
-    print(f"Transcript saved to: {output_file}")
+    log.info("Transcript saved to: %s", output_file)
 
-    if copy_to_clipboard:
-        pyperclip.copy(transcript)
-        print("Transcription text copied to clipboard.")
+    if copy_to_clipboard and copy_text_to_clipboard(transcript):
+        log.info("Transcription text copied to clipboard.")
 
-def main():
-    parser = argparse.ArgumentParser(description='Transcribe audio files using OpenAI Whisper API or Groq API')
-    parser.add_argument('input_file', help='Path to the audio or video file to transcribe')
-    parser.add_argument('-o', '--output', help='Output file for the transcript (default: input_file_transcript.txt)')
-    parser.add_argument('-c', '--copy', action='store_true', help='Copy transcript to clipboard')
-    parser.add_argument('--compress-only', action='store_true', help='Only compress the audio file, do not transcribe')
-    parser.add_argument('--api', choices=['openai', 'groq'], default='openai', help='API to use for transcription (default: openai)')
+def copy_text_to_clipboard(text):
+    """Pipe text to the platform clipboard tool in one buffered write, falling back to pyperclip
     
-    args = parser.parse_args()
+    Returns whether the text reached the clipboard, logging a warning when it didn't.
+    """
+    if sys.platform == 'darwin':
+        cmd = ['pbcopy']
+    elif sys.platform.startswith('linux'):
+        # wl-copy on Wayland sessions, xclip on X11
+        if os.environ.get('WAYLAND_DISPLAY') and shutil.which('wl-copy'):
+            cmd = ['wl-copy']
+        else:
+            cmd = ['xclip', '-selection', 'clipboard']
+    else:
+        # pyperclip talks to the Windows clipboard API directly, without a subprocess
+        cmd = None
     
-    input_file = args.input_file
+    if cmd is None or shutil.which(cmd[0]) is None:
+        import pyperclip
+        try:
+            pyperclip.copy(text)
+        except pyperclip.PyperclipException as e:
+            log.warning("Could not copy to clipboard: %s", e)
+            return False
+        return True
     
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=1 << 20)
+    process.communicate(text.encode('utf-8'))
+    if process.returncode != 0:
+        log.warning("Could not copy to clipboard: %s exited with status %d", cmd[0], process.returncode)
+        return False
+    return True
+
+def prepare_input(input_file, compress_only=False):
+    """Validate an input file and return (audio paths in order, segment dir or None), or None to skip it"""
     if not os.path.exists(input_file):
-        print(f"Error: Input file '{input_file}' does not exist.")
-        return
+        log.error("Error: Input file '%s' does not exist.", input_file)
+        return None
     
     if not is_valid_media_format(input_file):
-        print('Invalid media format. Supported formats: mp3, mp4, mpeg, mpga, m4a, wav, webm, avi, mov, mkv, flv, wmv')
-        return
+        log.error("Invalid media format for '%s'. Supported formats: mp3, mp4, mpeg, mpga, m4a, wav, webm, avi, mov, mkv, flv, wmv", input_file)
+        return None
 
-    if is_video_format(input_file):
-        input_file = extract_audio_from_video(input_file)
-    else:
-        file_size = os.path.getsize(input_file) / (1024 * 1024)  # File size in MB
-        print(f"Input file size: {file_size:.2f} MB")
+    media = probe_media(input_file)
+    target_size = 24.9 * 1024  # Target size in kilobytes (just under 25MB)
 
-        if file_size > 25:
-            target_size = 24.9 * 1024  # Target size in kilobytes (just under 25MB)
-            print(f"Target size: {target_size} KB")
+    if media.is_video:
+        # Encode straight to a bitrate that fits the limit instead of extracting and then re-compressing
+        bitrate = min(calculate_bitrate(media.duration_s, target_size), MAX_EXTRACT_BITRATE)
+        return [extract_and_compress(media.path, bitrate)], None
 
-            bitrate = calculate_bitrate(input_file, target_size)
+    log.info("Input file size: %.2f MB", media.size_mb)
 
-            compressed_file = f'{os.path.splitext(input_file)[0]}_compressed.mp3'
-            compress_audio(input_file, compressed_file, bitrate)
-            input_file = compressed_file
-        else:
-            print("Input file size is within the allowed limit. No compression needed.")
+    if media.size_mb > 25 and not compress_only:
+        segment_dir, segments = split_audio(media)
+        return segments, segment_dir
+
+    if media.size_mb > 25:
+        log.info("Target size: %s KB", target_size)
+
+        bitrate = calculate_bitrate(media.duration_s, target_size)
+
+        compressed_file = f'{os.path.splitext(media.path)[0]}_compressed.mp3'
+        compress_audio(media.path, compressed_file, bitrate)
+        return [compressed_file], None
+
+    log.info("Input file size is within the allowed limit. No compression needed.")
+    return [media.path], None
+
+async def transcribe_parts(api, audio_files, semaphore):
+    """Transcribe audio segments concurrently and join their text in order, or return None on failure"""
+    if api == 'openai':
+        transcribe = transcribe_audio_openai_async
+    else:
+        transcribe = transcribe_audio_groq_async
+    
+    texts = await asyncio.gather(*(transcribe(audio_file, semaphore) for audio_file in audio_files))
+    if any(text is None for text in texts):
+        return None
+    return " ".join(text.strip() for text in texts)
 
-    if not args.compress_only:
+async def process_one(input_file, args, executor, semaphore):
+    """Run one file through the extract -> compress/split -> transcribe pipeline"""
+    loop = asyncio.get_running_loop()
+    # ffmpeg runs in a subprocess, so a thread per file is enough to overlap the local stages
+    try:
+        prepared = await loop.run_in_executor(executor, prepare_input, input_file, args.compress_only)
+    except subprocess.CalledProcessError as e:
+        log.error("Error while processing %s: %s", input_file, e.stderr.decode(errors='replace').strip())
+        return
+    except (KeyError, ValueError, ZeroDivisionError, OSError) as e:
+        # Unreadable ffprobe output (no or zero duration) or a file that vanished; skip just this file
+        log.error("Error while processing %s: %s: %s", input_file, type(e).__name__, e)
+        return
+    if prepared is None or args.compress_only:
+        return
+    audio_files, segment_dir = prepared
+    
+    # Segments live in a temporary directory, even when there is only one; name the transcript after the original file
+    output_base = os.path.splitext(input_file if segment_dir else audio_files[0])[0]
+    
+    apis = ['openai', 'groq'] if args.api == 'both' else [args.api]
+    try:
+        # With --api both, wall time is that of the slower provider rather than the sum
+        transcripts = await asyncio.gather(*(transcribe_parts(api, audio_files, semaphore) for api in apis))
+    finally:
+        if segment_dir:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+    
+    for api, transcript in zip(apis, transcripts):
+        if transcript is None:
+            continue
+        
         if args.output is None:
-            output_file = f'{os.path.splitext(input_file)[0]}_transcript.txt'
+            suffix = f'_{api}_transcript.txt' if len(apis) > 1 else '_transcript.txt'
+            output_file = f'{output_base}{suffix}'
+        elif len(apis) > 1:
+            root, extension = os.path.splitext(args.output)
+            output_file = f'{root}_{api}{extension}'
         else:
             output_file = args.output
-        
-        api_choice = args.api
-        if api_choice == 'openai':
-            transcribe_audio_openai(input_file, output_file, args.copy)
-        else:
-            transcribe_audio_groq(input_file, output_file, args.copy)
+        save_transcript(transcript, output_file, args.copy)
+
+async def main_async(args):
+    """Process all input files, overlapping local preparation with transcription"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRANSCRIPTIONS)
+    with ThreadPoolExecutor(max_workers=MAX_PREPARE_WORKERS) as executor:
+        await asyncio.gather(*(
+            process_one(input_file, args, executor, semaphore)
+            for input_file in args.input_files
+        ))
+
+def main():
+    parser = argparse.ArgumentParser(description='Transcribe audio files using OpenAI Whisper API or Groq API')
+    parser.add_argument('input_files', nargs='+', metavar='input_file', help='Path to one or more audio or video files to transcribe')
+    parser.add_argument('-o', '--output', help='Output file for the transcript (default: input_file_transcript.txt, single input only)')
+    parser.add_argument('-c', '--copy', action='store_true', help='Copy transcript to clipboard')
+    parser.add_argument('--compress-only', action='store_true', help='Only compress the audio file, do not transcribe')
+    parser.add_argument('--api', choices=['openai', 'groq', 'both'], default='openai', help='API to use for transcription, or both to run them side by side (default: openai)')
+    
+    args = parser.parse_args()
+    # SDK/httpx loggers stay at the root WARNING level; only this script's progress is shown
+    logging.basicConfig(format="%(message)s")
+    log.setLevel(logging.INFO)
+    
+    if args.output is not None and len(args.input_files) > 1:
+        log.error("Error: --output can only be used with a single input file.")
+        return
+    
+    asyncio.run(main_async(args))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,19 +1,58 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import os
 import time
+import random
 import subprocess
+import io
 import tempfile
-import pyperclip
 import requests
+import mimetypes
 import json
+import orjson
 import shutil
+import hashlib
 import base64
 import re
 import sqlite3
+import threading
+import atexit
+import queue
+import functools
+import math
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from contextlib import contextmanager
 from datetime import datetime
-from groq import Groq
-from openai import OpenAI  # Updated import
-import yt_dlp  # Added for YouTube downloading
+from string import Template
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+
+# Optional faster hash for the transcript cache
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+# Shared pool for blocking API calls so the script thread can keep the status updated
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+# Transient gateway errors worth retrying
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# Shared HTTP session for tmpfiles.org and Fal so TLS connections survive across transcriptions
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.trust_env = False  # Don't use environment variables for proxy settings
+# The adapter only retries a failed connect once, immediately; timeouts, dropped connections
+# and 5xx responses are retried with backoff by post_with_retry. With its 3 attempts a request
+# is sent at most 3 times and opens at most 6 connections, instead of the layers multiplying.
+HTTP_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(connect=1, read=0, status=0, other=0)
+))
 
 # Database setup
 def get_db_path():
@@ -23,210 +62,619 @@ def get_db_path():
     os.makedirs(data_dir, exist_ok=True)
     return os.path.join(data_dir, "transcription_history.db")
 
-def init_db():
-    """Initialize the database with the necessary tables."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    # Create transcriptions table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS transcriptions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        source_name TEXT NOT NULL,
-        source_type TEXT NOT NULL,
-        api_used TEXT NOT NULL,
-        language TEXT NOT NULL,
-        duration REAL,
-        transcript TEXT NOT NULL,
-        favorite BOOLEAN DEFAULT 0
-    )
-    ''')
+def open_db_connection():
+    """Open a connection to the history database, tuned for long-lived use."""
+    # Transactions are managed explicitly in db_transaction and the writer thread;
+    # a busy connection waits up to 5s for another one's write to finish. Pooled
+    # connections move between threads, but only one thread uses each at a time.
+    conn = sqlite3.connect(get_db_path(), isolation_level=None, timeout=5, check_same_thread=False)
+    # WAL is persistent, and lets readers on other connections run alongside a commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL only needs a full fsync at checkpoints at this level
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-65536")  # 64MB
+    return conn
+
+# Idle connections kept for reuse; concurrent callers beyond this get a connection that is closed after use
+DB_POOL_SIZE = 4
+
+@st.cache_resource
+def get_db_pool():
+    """Return the process-wide pool of idle connections, so reruns reuse tuned connections."""
+    return queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+@contextmanager
+def get_db_connection():
+    """Borrow a history database connection from the pool, opening one if none is idle."""
+    pool = get_db_pool()
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = open_db_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            # A transaction that couldn't be rolled back; don't hand it to the next caller
+            conn.close()
+        else:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+@contextmanager
+def db_transaction(conn=None):
+    """Yield a connection whose statements are committed together.
+    
+    Pass an existing connection to run several helpers inside the caller's
+    transaction; the caller is then responsible for committing it.
+    """
+    if conn is not None:
+        yield conn
+        return
     
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        # Take the write lock up front so the transaction can't fail halfway with SQLITE_BUSY
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
 
-def save_transcription(source_name, source_type, api_used, language, duration, transcript):
-    """Save a transcription to the database."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
+@contextmanager
+def db_read(conn=None):
+    """Yield a connection for read-only queries, which run in autocommit mode."""
+    if conn is not None:
+        yield conn
+        return
     
+    with get_db_connection() as conn:
+        yield conn
+
+# Longest the UI waits on a queued write before reporting it as failed
+WRITE_TIMEOUT = 15
+
+# History writes are queued to one writer thread with its own connection; WAL lets
+# the other threads' connections keep serving reads while that thread commits
+def _writer_loop(jobs):
+    conn = None
+    while True:
+        # Group every write already waiting into one commit, so a burst pays for a single fsync;
+        # None asks the writer to stop once the writes queued before it are done
+        batch = [jobs.get()]
+        while batch[-1] is not None:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        writes = [job for job in batch if job is not None]
+        try:
+            if conn is None and writes:
+                conn = open_db_connection()
+            if writes:
+                _commit_batch(conn, [(write, future) for write, future in writes if future.set_running_or_notify_cancel()])
+        except Exception as e:
+            # The connection couldn't be opened or rolled back: fail this batch and reopen for the next
+            for write, future in writes:
+                if not future.done():
+                    future.set_exception(e)
+            if conn is not None:
+                conn.close()
+            conn = None
+        finally:
+            for _ in batch:
+                jobs.task_done()
+        if batch[-1] is None:
+            if conn is not None:
+                conn.close()
+            return
+
+def _commit_batch(conn, batch):
+    """Run the writes in one transaction, each in a savepoint so a failing write doesn't undo the others."""
+    done = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for write, future in batch:
+            conn.execute("SAVEPOINT write")
+            try:
+                result = write(conn)
+            except Exception as e:
+                conn.execute("ROLLBACK TO write")
+                conn.execute("RELEASE write")
+                future.set_exception(e)
+            else:
+                conn.execute("RELEASE write")
+                done.append((future, result))
+        conn.execute("COMMIT")
+        # Clear before resolving the futures, so a rerun waiting on them reads fresh history
+        if done:
+            cached_history.clear()
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        for write, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    for future, result in done:
+        future.set_result(result)
+
+# The queue is created here rather than at module level: Streamlit re-executes this script on
+# every rerun, and a module-level queue would be a new one that the cached thread never drains
+@st.cache_resource
+def start_db_writer():
+    """Start the writer thread once per process and return it with its queue, flushing queued writes at exit."""
+    jobs = queue.Queue()
+    thread = threading.Thread(target=_writer_loop, args=(jobs,), name="db-writer", daemon=True)
+    thread.start()
+    atexit.register(jobs.join)
+    return thread, jobs
+
+def queue_write(write, conn=None):
+    """Run write(conn) in its own transaction on the writer thread and return a Future of its result.
+    
+    With an explicit connection the write runs inline inside the caller's
+    transaction instead, and the returned Future is already resolved.
+    """
+    future = Future()
+    if conn is not None:
+        future.set_result(write(conn))
+        return future
+    
+    thread, jobs = start_db_writer()
+    if not thread.is_alive():
+        # Start a fresh writer if the cached one died, instead of queueing writes nobody drains
+        start_db_writer.clear()
+        thread, jobs = start_db_writer()
+    jobs.put((write, future))
+    return future
+
+def wait_for_write(future):
+    """Return a queued write's result, raising instead of blocking forever if the writer stalls."""
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except FutureTimeoutError:
+        raise sqlite3.OperationalError(f"the history database didn't finish the write within {WRITE_TIMEOUT} seconds") from None
+
+def init_db(conn=None):
+    """Initialize the database with the necessary tables."""
+    with db_transaction(conn) as conn:
+        cursor = conn.cursor()
+        
+        # Create transcriptions table
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transcriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            source_name TEXT NOT NULL,
+            source_type TEXT NOT NULL,
+            api_used TEXT NOT NULL,
+            language TEXT NOT NULL,
+            duration REAL,
+            transcript TEXT NOT NULL,
+            favorite BOOLEAN DEFAULT 0,
+            content_hash TEXT
+        )
+        ''')
+        
+        # Digest of the transcribed audio, so saved history also serves as a transcript cache;
+        # databases created before the column existed get it added
+        cursor.execute("PRAGMA table_info(transcriptions)")
+        if 'content_hash' not in {column[1] for column in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE transcriptions ADD COLUMN content_hash TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_content_hash ON transcriptions(content_hash, api_used, language)")
+
+        # Transcripts keyed by audio content hash, API and language, evicted least-recently-used
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transcript_cache (
+            cache_key TEXT PRIMARY KEY,
+            transcript TEXT NOT NULL,
+            last_used REAL NOT NULL
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON transcript_cache(last_used)")
+
+        # Full-text index over the searchable columns, kept in sync with the table by triggers
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'transcriptions_fts'")
+        fts_exists = cursor.fetchone()[0] > 0
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS transcriptions_fts
+        USING fts5(transcript, source_name, content='transcriptions', content_rowid='id')
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transcriptions_fts_insert AFTER INSERT ON transcriptions BEGIN
+            INSERT INTO transcriptions_fts(rowid, transcript, source_name) VALUES (new.id, new.transcript, new.source_name);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transcriptions_fts_delete AFTER DELETE ON transcriptions BEGIN
+            INSERT INTO transcriptions_fts(transcriptions_fts, rowid, transcript, source_name)
+            VALUES ('delete', old.id, old.transcript, old.source_name);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transcriptions_fts_update AFTER UPDATE OF transcript, source_name ON transcriptions BEGIN
+            INSERT INTO transcriptions_fts(transcriptions_fts, rowid, transcript, source_name)
+            VALUES ('delete', old.id, old.transcript, old.source_name);
+            INSERT INTO transcriptions_fts(rowid, transcript, source_name) VALUES (new.id, new.transcript, new.source_name);
+        END
+        ''')
+        if not fts_exists:
+            # Index the rows saved before full-text search existed
+            cursor.execute("INSERT INTO transcriptions_fts(transcriptions_fts) VALUES ('rebuild')")
+
+        # Indexes backing the history view's ORDER BY and its favorites filter
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = 'idx_tx_fav_ts'")
+        indexes_exist = cursor.fetchone()[0] > 0
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_ts ON transcriptions(timestamp DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tx_fav_ts ON transcriptions(favorite, timestamp DESC)")
+        if not indexes_exist:
+            # Give the query planner statistics for the new indexes
+            cursor.execute("ANALYZE")
+
+def save_transcription(source_name, source_type, api_used, language, duration, transcript, content_hash=None, conn=None):
+    """Queue a transcription for saving, returning a Future of its row id."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    cursor.execute('''
-    INSERT INTO transcriptions 
-    (timestamp, source_name, source_type, api_used, language, duration, transcript)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (timestamp, source_name, source_type, api_used, language, duration, transcript))
+    def write(conn):
+        cursor = conn.execute('''
+        INSERT INTO transcriptions 
+        (timestamp, source_name, source_type, api_used, language, duration, transcript, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (timestamp, source_name, source_type, api_used, language, duration, transcript, content_hash))
+        return cursor.lastrowid
     
-    conn.commit()
-    conn.close()
+    return queue_write(write, conn)
+
+def save_transcriptions_bulk(rows, content_hash=None, conn=None):
+    """Queue several transcriptions to be saved in one transaction, returning a Future.
+
+    Each row is a (source_name, source_type, api_used, language, duration, transcript)
+    tuple; all rows get the same timestamp and audio content hash.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [(timestamp, *row, content_hash) for row in rows]
     
-    return cursor.lastrowid
+    return queue_write(lambda conn: conn.executemany('''
+        INSERT INTO transcriptions 
+        (timestamp, source_name, source_type, api_used, language, duration, transcript, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows), conn)
+
+def build_fts_query(search_term):
+    """Turn free-text input into an FTS5 query matching every word as a prefix."""
+    # Quoting each word keeps FTS5 operators and punctuation in the input from being parsed
+    words = re.findall(r'\w+', search_term)
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+# Rows shown per page in the History tab
+HISTORY_PAGE_SIZE = 10
+
+def get_transcription_history(limit=100, offset=0, search_term=None, favorites_only=False, conn=None):
+    """Get a page of transcription history from the database, newest first.
 
-def get_transcription_history(limit=100, offset=0, search_term=None):
-    """Get transcription history from the database."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
+    Each row ends with the total number of matching rows, so callers can show
+    a count without a second SELECT COUNT(*) query.
+    """
+    fts_query = build_fts_query(search_term) if search_term else None
     
-    if search_term:
-        cursor.execute('''
-        SELECT id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite
-        FROM transcriptions
-        WHERE transcript LIKE ? OR source_name LIKE ?
-        ORDER BY timestamp DESC
-        LIMIT ? OFFSET ?
-        ''', (f'%{search_term}%', f'%{search_term}%', limit, offset))
-    else:
-        cursor.execute('''
-        SELECT id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite
+    # Filters go into the WHERE clause so LIMIT/OFFSET page over matching rows only
+    conditions, params = [], []
+    if fts_query:
+        conditions.append("id IN (SELECT rowid FROM transcriptions_fts WHERE transcriptions_fts MATCH ?)")
+        params.append(fts_query)
+    if favorites_only:
+        conditions.append("favorite = 1")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    with db_read(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite,
+               COUNT(*) OVER () AS total
         FROM transcriptions
+        {where}
         ORDER BY timestamp DESC
         LIMIT ? OFFSET ?
-        ''', (limit, offset))
-    
-    results = cursor.fetchall()
-    conn.close()
+        ''', (*params, limit, offset))
+        results = cursor.fetchall()
     
     return results
 
-def get_transcription_by_id(transcription_id):
+# Reruns repeat the same history queries on every widget interaction; the writer
+# thread clears this after each commit, so the TTL only bounds staleness from other processes
+@st.cache_data(ttl=30, show_spinner=False)
+def cached_history(limit=100, offset=0, search_term=None, favorites_only=False):
+    """Memoized get_transcription_history for the UI."""
+    return get_transcription_history(limit=limit, offset=offset, search_term=search_term, favorites_only=favorites_only)
+
+def get_transcription_by_id(transcription_id, conn=None):
     """Get a specific transcription by ID."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite
-    FROM transcriptions
-    WHERE id = ?
-    ''', (transcription_id,))
-    
-    result = cursor.fetchone()
-    conn.close()
+    with db_read(conn) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite
+        FROM transcriptions
+        WHERE id = ?
+        ''', (transcription_id,))
+        
+        result = cursor.fetchone()
     
     return result
 
-def toggle_favorite(transcription_id, favorite_status):
-    """Toggle the favorite status of a transcription."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    UPDATE transcriptions
-    SET favorite = ?
-    WHERE id = ?
-    ''', (1 if favorite_status else 0, transcription_id))
-    
-    conn.commit()
-    conn.close()
+def toggle_favorite(transcription_id, favorite_status, conn=None):
+    """Queue a change to the favorite status of a transcription, returning a Future."""
+    return queue_write(lambda conn: conn.execute('''
+        UPDATE transcriptions
+        SET favorite = ?
+        WHERE id = ?
+        ''', (1 if favorite_status else 0, transcription_id)), conn)
 
-def delete_transcription(transcription_id):
-    """Delete a transcription from the database."""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    DELETE FROM transcriptions
-    WHERE id = ?
-    ''', (transcription_id,))
-    
-    conn.commit()
-    conn.close()
+def delete_transcription(transcription_id, conn=None):
+    """Queue a transcription for deletion, returning a Future."""
+    return queue_write(lambda conn: conn.execute('''
+        DELETE FROM transcriptions
+        WHERE id = ?
+        ''', (transcription_id,)), conn)
 
-def export_transcriptions_to_json(file_path):
-    """Export all transcriptions to a JSON file."""
-    conn = sqlite3.connect(get_db_path())
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite
-    FROM transcriptions
-    ORDER BY timestamp DESC
-    ''')
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    # Convert rows to dictionaries
-    transcriptions = []
-    for row in rows:
-        transcriptions.append(dict(row))
+def find_transcript_by_hash(content_hash, api_used, language, conn=None):
+    """Return the newest saved transcript of the same audio, API and language, or None."""
+    with db_read(conn) as conn:
+        row = conn.execute('''
+        SELECT transcript FROM transcriptions
+        WHERE content_hash = ? AND api_used = ? AND language = ?
+        ORDER BY timestamp DESC
+        LIMIT 1
+        ''', (content_hash, api_used, language)).fetchone()
+    return row[0] if row else None
+
+def export_transcriptions_to_json(file_path, conn=None):
+    """Export all transcriptions to a UTF-8 JSON file, writing one row at a time."""
+    with db_read(conn) as conn, open(file_path, 'wb') as f:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute('''
+        SELECT id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite
+        FROM transcriptions
+        ORDER BY timestamp DESC
+        ''')
+        
+        # Iterate the cursor lazily, writing the same layout as json.dump(rows, f, indent=2)
+        empty = True
+        f.write(b'[')
+        for row in cursor:
+            f.write(b'\n  ' if empty else b',\n  ')
+            f.write(orjson.dumps(dict(row), option=orjson.OPT_INDENT_2).replace(b'\n', b'\n  '))
+            empty = False
+        f.write(b']' if empty else b'\n]')
+
+# Transcript cache
+TRANSCRIPT_CACHE_MAX_ENTRIES = 500
+
+def hash_audio(audio):
+    """Return the hex digest of an audio file or stream, read in 1MB chunks.
     
-    with open(file_path, 'w') as f:
-        json.dump(transcriptions, f, indent=4)
+    Uses BLAKE3 when the blake3 package is installed, SHA-256 otherwise.
+    Files are hashed once per version, like their duration probe.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        stat = os.stat(audio)
+        return _hash_file(os.fspath(audio), stat.st_mtime_ns, stat.st_size)
+    return _hash_stream(audio)
+
+@functools.lru_cache(maxsize=256)
+def _hash_file(path, mtime_ns, size):
+    return _hash_stream(path)
+
+def _hash_stream(audio):
+    digest = blake3() if blake3 else hashlib.sha256()
+    with open_audio(audio) as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_cached_transcript(cache_key, conn=None):
+    """Return the cached transcript for a key, or None, queueing a touch that marks it as recently used."""
+    with db_read(conn) as read_conn:
+        row = read_conn.execute("SELECT transcript FROM transcript_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+    if row is None:
+        return None
+    last_used = time.time()
+    queue_write(lambda conn: conn.execute(
+        "UPDATE transcript_cache SET last_used = ? WHERE cache_key = ?", (last_used, cache_key)
+    ), conn)
+    return row[0]
+
+def cache_transcript(cache_key, transcript, conn=None):
+    """Queue a transcript for the cache, evicting the least recently used entries over the limit; returns a Future."""
+    last_used = time.time()
+    def write(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO transcript_cache (cache_key, transcript, last_used) VALUES (?, ?, ?)",
+            (cache_key, transcript, last_used)
+        )
+        conn.execute('''
+        DELETE FROM transcript_cache WHERE cache_key NOT IN (
+            SELECT cache_key FROM transcript_cache ORDER BY last_used DESC LIMIT ?
+        )
+        ''', (TRANSCRIPT_CACHE_MAX_ENTRIES,))
+    return queue_write(write, conn)
+
+def clear_transcript_cache(conn=None):
+    """Queue the removal of every cached transcript, returning a Future."""
+    return queue_write(lambda conn: conn.execute("DELETE FROM transcript_cache"), conn)
 
-# Initialize database at startup
-init_db()
+@st.cache_resource
+def ensure_db():
+    """Create and migrate the history database once per process, from main() rather than at import."""
+    init_db()
 
+@st.cache_resource
+def get_ffmpeg_path():
+    """Resolve the ffmpeg executable once per process instead of on every subprocess call"""
+    return shutil.which('ffmpeg') or 'ffmpeg'
+
+@st.cache_resource
 def is_ffmpeg_installed():
-    try:
-        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
-        return result.returncode == 0
-    except FileNotFoundError:
-        return False
+    # A PATH lookup, cached, instead of spawning `ffmpeg -version` on every rerun
+    return shutil.which('ffmpeg') is not None
 
 def get_audio_info(audio_file):
-    cmd = ['ffprobe', '-i', audio_file, '-show_entries', 'format=duration', '-v', 'quiet', '-of', 'json']
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    """Return the media duration in seconds, running ffprobe once per version of a file."""
+    return probe_media(audio_file)[0]
+
+def probe_media(audio_file):
+    """Return (duration, audio codec, audio bit rate in bits/s), with None for what ffprobe doesn't report."""
+    stat = os.stat(audio_file)
+    return _probe_media(os.fspath(audio_file), stat.st_mtime_ns, stat.st_size)
+
+# Keyed on mtime and size too, so a file rewritten in place is probed again
+@functools.lru_cache(maxsize=256)
+def _probe_media(path, mtime_ns, size):
+    cmd = ['ffprobe', '-i', path, '-show_entries', 'format=duration:stream=codec_type,codec_name,bit_rate', '-v', 'quiet', '-of', 'json']
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
     data = json.loads(result.stdout)
-    return float(data['format']['duration'])
+    audio = next((stream for stream in data.get('streams', []) if stream.get('codec_type') == 'audio'), {})
+    # Some containers (e.g. WebM) don't record a per-stream bit rate
+    bit_rate = audio.get('bit_rate')
+    return float(data['format']['duration']), audio.get('codec_name'), int(bit_rate) if bit_rate and bit_rate.isdigit() else None
 
-def compress_audio(input_file, target_size=24.9 * 1024):
-    output_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3').name
-    duration = get_audio_info(input_file)
-    target_bitrate = int((target_size * 8) / (1.048576 * duration))
-    
-    cmd = ['ffmpeg', '-i', input_file, '-b:a', f'{target_bitrate}k', '-y', output_file]
-    subprocess.run(cmd, capture_output=True)
-    return output_file
+def try_get_audio_info(audio_file):
+    """Return the media duration, or None when the file can't be probed."""
+    try:
+        return get_audio_info(audio_file)
+    except (OSError, ValueError, KeyError):
+        return None
+
+# Whisper resamples everything to 16 kHz mono, so anything more is wasted upload
+SPEECH_ENCODE_ARGS = ['-vn', '-ar', '16000', '-ac', '1', '-c:a', 'libmp3lame']
+SPEECH_BITRATE = 48  # kbps; about 72 minutes fits under 25MB
 
 def calculate_bitrate(duration, target_size):
     bitrate = (target_size * 8) / (1.048576 * duration)
     return int(bitrate)
 
+# Supported upload extensions
+VALID_MEDIA_FORMATS = frozenset({
+    # Audio formats
+    '.mp3', '.mp4', '.mpeg', '.mpga', '.m4a', '.wav', '.webm',
+    # Video formats
+    '.avi', '.mov', '.mkv', '.flv', '.wmv', '.m4v'
+})
+VIDEO_FORMATS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v'})
+
 def is_valid_media_format(filename):
-    valid_formats = [
-        # Audio formats
-        '.mp3', '.mp4', '.mpeg', '.mpga', '.m4a', '.wav', '.webm',
-        # Video formats
-        '.avi', '.mov', '.mkv', '.flv', '.wmv'
-    ]
-    _, extension = os.path.splitext(filename)
-    return extension.lower() in valid_formats
+    return os.path.splitext(filename)[1].lower() in VALID_MEDIA_FORMATS
 
 def is_video_format(filename):
-    video_formats = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
-    _, extension = os.path.splitext(filename)
-    return extension.lower() in video_formats
+    return os.path.splitext(filename)[1].lower() in VIDEO_FORMATS
+
+# Audio codecs every API accepts as-is, and the container their track is copied into
+COPYABLE_AUDIO_CODECS = {'aac': '.m4a', 'mp3': '.mp3', 'opus': '.ogg'}
 
-def extract_audio_from_video(video_file_path):
-    """Extract audio track from a video file using FFmpeg"""
-    output_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3').name
+def extract_audio_copy(input_file, target_size):
+    """Copy a media file's audio track out without re-encoding it.
     
-    cmd = ['ffmpeg', '-i', video_file_path, '-vn', '-acodec', 'mp3', '-y', output_file]
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    Returns the path of the extracted track, written next to the input, or None
+    when the codec can't be sent as-is or the track is over `target_size` KB.
+    """
+    duration, codec, bit_rate = probe_media(input_file)
+    extension = COPYABLE_AUDIO_CODECS.get(codec)
+    if extension is None:
+        return None
+    # Skip the copy when the probed bit rate already says the track won't fit
+    if bit_rate and bit_rate * duration / 8 > target_size * 1024:
+        return None
     
-    if result.returncode != 0:
-        raise Exception(f"Failed to extract audio from video: {result.stderr}")
+    output_file = os.path.splitext(input_file)[0] + '_audio' + extension
+    cmd = [get_ffmpeg_path(), '-i', input_file, '-vn', '-map', '0:a:0', '-c:a', 'copy', '-y', output_file]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if result.returncode == 0 and os.path.getsize(output_file) <= target_size * 1024:
+        return output_file
+    try:
+        os.unlink(output_file)
+    except FileNotFoundError:
+        pass
+    return None
+
+def prepare_audio_stream(input_file, target_size=24.9 * 1024):
+    """Get the audio track of a media file ready for upload, returning (audio, duration).
+    
+    A track the APIs accept is copied out to a file beside the input; anything
+    else is extracted and compressed in one FFmpeg pass into an in-memory MP3.
+    """
+    duration = get_audio_info(input_file)
+    copied = extract_audio_copy(input_file, target_size)
+    if copied is not None:
+        return copied, duration
     
-    return output_file
+    # Speech bitrate unless the file is too long for it to fit
+    target_bitrate = min(calculate_bitrate(duration, target_size), SPEECH_BITRATE)
+    
+    cmd = [get_ffmpeg_path(), '-i', input_file, *SPEECH_ENCODE_ARGS, '-b:a', f'{target_bitrate}k', '-f', 'mp3', 'pipe:1']
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    
+    if process.returncode != 0:
+        raise Exception(f"Failed to prepare audio: {stderr.decode(errors='replace')}")
+    
+    # The SDKs use the name to detect the upload format
+    audio_stream = io.BytesIO(stdout)
+    audio_stream.name = os.path.splitext(os.path.basename(input_file))[0] + '.mp3'
+    return audio_stream, duration
+
+@contextmanager
+def open_audio(audio):
+    """Yield a readable binary file for either a path or an in-memory audio stream"""
+    if isinstance(audio, (str, os.PathLike)):
+        with open(audio, 'rb') as file:
+            yield file
+    else:
+        audio.seek(0)
+        yield audio
 
-def upload_to_tmpfiles(file_path):
+def post_with_retry(send, on_retry=None, attempts=3):
+    """Call send(), retrying timeouts, dropped connections and 5xx gateway errors with exponential backoff."""
+    for attempt in range(attempts):
+        try:
+            response = send()
+            if response.status_code not in RETRY_STATUS_CODES or attempt == attempts - 1:
+                return response
+            reason = f"status code {response.status_code}"
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if attempt == attempts - 1:
+                raise
+            reason = type(e).__name__
+        
+        delay = 2 ** attempt + random.uniform(0, 1)
+        if on_retry:
+            on_retry(attempt + 1, reason, delay)
+        time.sleep(delay)
+
+def upload_to_tmpfiles(audio, on_retry=None):
     url = 'https://tmpfiles.org/api/v1/upload'
     
     try:
-        # Create session without proxy settings
-        session = requests.Session()
-        session.trust_env = False
-        
-        with open(file_path, 'rb') as file:
-            files = {'file': file}
-            response = session.post(url, files=files, timeout=30)  # Add timeout
+        with open_audio(audio) as file:
+            name = os.path.basename(file.name)
+            
+            def send():
+                # Stream the multipart body from the file instead of building it in memory,
+                # rewinding first so a retry sends the whole file again
+                file.seek(0)
+                encoder = MultipartEncoder(fields={'file': (name, file, mimetypes.guess_type(name)[0] or 'audio/mpeg')})
+                return HTTP_SESSION.post(url, data=encoder, headers={'Content-Type': encoder.content_type}, timeout=30)  # Add timeout
+            
+            response = post_with_retry(send, on_retry=on_retry)
         
         if response.status_code == 200:
             try:
-                response_data = json.loads(response.text)
+                response_data = orjson.loads(response.content)
                 # The API returns a data URL, we need to modify it to get the direct file URL
                 data_url = response_data['data']['url']
                 file_url = data_url.replace('https://tmpfiles.org/', 'https://tmpfiles.org/dl/')
@@ -238,94 +686,458 @@ def upload_to_tmpfiles(file_path):
     except requests.exceptions.RequestException as e:
         raise Exception(f"Network error during file upload: {str(e)}")
 
-def transcribe_audio_groq(input_file, language="auto"):
-    if not st.session_state.GROQ_API_KEY:
-        raise ValueError("Groq API key is not set")
-    
-    # Initialize client with explicit API key
+def retry_after_seconds(response, default):
+    """Read a numeric Retry-After header, capped at a minute, falling back to the given delay."""
     try:
-        client = Groq(api_key=st.session_state.GROQ_API_KEY)
+        return min(float(response.headers.get('retry-after', default)), 60)
+    except (AttributeError, ValueError):
+        return default
+
+class KeyPool:
+    """Hands out the least-loaded of several API keys for one provider.
+    
+    Each key's concurrency cap is halved when it gets rate limited and grows by
+    one after every success, up to max_concurrency, and a limited key is
+    skipped until its Retry-After delay has passed.
+    """
+    
+    def __init__(self, keys, max_concurrency=4):
+        self.max_concurrency = max_concurrency
+        self._caps = dict.fromkeys(keys, max_concurrency)
+        self._in_flight = dict.fromkeys(keys, 0)
+        self._limited_until = dict.fromkeys(keys, 0.0)
+        self._changed = threading.Condition()
+    
+    def acquire(self):
+        """Block until a key has spare capacity and isn't cooling down, then reserve it."""
+        with self._changed:
+            while True:
+                now = time.monotonic()
+                free = [key for key, cap in self._caps.items() if self._in_flight[key] < cap]
+                ready = [key for key in free if self._limited_until[key] <= now]
+                if ready:
+                    key = min(ready, key=lambda key: self._in_flight[key] / self._caps[key])
+                    self._in_flight[key] += 1
+                    return key
+                # Wake when a cooldown ends or another call releases its key
+                self._changed.wait(min((self._limited_until[key] - now for key in free), default=None))
+    
+    def release(self, key, retry_after=None, succeeded=True):
+        """Return a key, passing retry_after in seconds when the call was rate limited.
         
-        with open(input_file, "rb") as file:
-            start_time = time.time()
-            transcription = client.audio.transcriptions.create(
-                file=(input_file, file.read()),
-                model="whisper-large-v3",
-                language=None if language == "auto" else language
-            )
-            end_time = time.time()
-        return transcription.text, end_time - start_time
-    except Exception as e:
-        if "api_key" in str(e).lower():
-            raise ValueError(f"Groq API key error: {str(e)}")
+        Pass succeeded=False for other failures, which leave the key's cap unchanged.
+        """
+        with self._changed:
+            self._in_flight[key] -= 1
+            if retry_after is None:
+                if succeeded:
+                    self._caps[key] = min(self.max_concurrency, self._caps[key] + 1)
+            else:
+                self._caps[key] = max(1, self._caps[key] // 2)
+                self._limited_until[key] = time.monotonic() + retry_after
+            self._changed.notify_all()
+
+def split_api_keys(value):
+    """Split a key setting holding one or more comma- or space-separated keys into a tuple."""
+    return tuple(key for key in re.split(r'[\s,]+', value or '') if key)
+
+# Pools are shared across sessions so every caller using a key sees its rate limits
+@functools.lru_cache(maxsize=8)
+def get_key_pool(api_name, keys):
+    return KeyPool(keys)
+
+def retry_rate_limited(pool, file, call, attempts=3):
+    """Run call(key) with a key from the pool, resending the file on another key when rate limited."""
+    for attempt in range(attempts):
+        key = pool.acquire()
+        try:
+            file.seek(0)
+            result = call(key)
+        except Exception as e:
+            # Both SDKs raise an error carrying the status code and HTTP response; their own retries are off
+            if getattr(e, 'status_code', None) != 429:
+                pool.release(key, succeeded=False)
+                raise
+            delay = retry_after_seconds(getattr(e, 'response', None), default=2 ** attempt)
+            pool.release(key, retry_after=delay)
+            if attempt == attempts - 1:
+                raise
+            st.toast(f"Rate limited. Retrying ({attempts - attempt - 1} attempts left)...")
         else:
-            raise Exception(f"Groq transcription error: {str(e)}")
+            pool.release(key)
+            return result
+
+@functools.lru_cache(maxsize=1)
+def get_sdk_http_client():
+    """Return the pooled httpx client shared by the Groq and OpenAI SDK clients."""
+    import httpx  # Imported on first use along with the SDKs
+    try:
+        import h2  # noqa: F401  Optional; lets httpx negotiate HTTP/2
+        http2 = True
+    except ImportError:
+        http2 = False
+    # Supplying our own client also keeps older SDKs from passing the 'proxies' argument httpx 0.28 removed
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        timeout=300
+    )
+
+# Clients are kept per API key so back-to-back transcriptions reuse their connection pools.
+# SDK retries are off: retry_rate_limited is the only retry layer, and moves a 429 to another key.
+@functools.lru_cache(maxsize=4)
+def get_groq_client(api_key):
+    from groq import Groq  # Imported on first use so startup doesn't pay for unused SDKs
+    return Groq(api_key=api_key, http_client=get_sdk_http_client(), max_retries=0)
+
+@functools.lru_cache(maxsize=4)
+def get_openai_client(api_key):
+    from openai import OpenAI  # Imported on first use so startup doesn't pay for unused SDKs
+    return OpenAI(api_key=api_key, http_client=get_sdk_http_client(), max_retries=0)
+
+class TranscriptionError(Exception):
+    """Raised when a transcription API call fails, with the provider named in the message."""
 
-def transcribe_audio_openai(input_file, language="auto"):
-    if not st.session_state.OPENAI_API_KEY:
-        raise ValueError("OpenAI API key is not set")
+def _groq_call(api_key, file, language):
+    client = get_groq_client(api_key)
+    return client.audio.transcriptions.create(
+        file=(os.path.basename(file.name), file),  # Let the SDK stream the handle instead of copying it into memory
+        model="whisper-large-v3",
+        language=None if language == "auto" else language
+    ).text
+
+def _openai_call(api_key, file, language):
+    client = get_openai_client(api_key)
+    return client.audio.transcriptions.create(
+        model="whisper-1",
+        file=file,
+        language=None if language == "auto" else language
+    ).text
+
+def _fal_call(api_key, file, language):
+    # Upload the file and get the URL, opening the Fal connection in the background meanwhile
+    with st.status("Uploading file to temporary storage...") as status, ThreadPoolExecutor(max_workers=1) as executor:
+        warmup = executor.submit(HTTP_SESSION.head, "https://fal.run", timeout=10)
+        audio_url = upload_to_tmpfiles(
+            file,
+            on_retry=lambda attempt, reason, delay: status.update(
+                label=f"Upload attempt {attempt} failed ({reason}). Retrying in {delay:.1f}s...", state="running"
+            )
+        )
+        try:
+            warmup.result()
+        except requests.exceptions.RequestException:
+            pass  # The real request will reconnect and report any error
+        status.update(label="File uploaded successfully. Sending to Fal API...", state="running")
     
-    # Use the newer OpenAI client syntax
-    client = OpenAI(api_key=st.session_state.OPENAI_API_KEY)
+    data = {
+        "audio_url": audio_url,
+        "task": "transcribe",
+        "language": "auto" if language == "auto" else language,
+        "chunk_level": "segment",
+        "version": "3"
+    }
+    headers = {"Authorization": f"Key {api_key}", "Content-Type": "application/json"}
+    response = post_with_retry(
+        lambda: HTTP_SESSION.post("https://fal.run/fal-ai/wizper", headers=headers, json=data, timeout=120),
+        on_retry=lambda attempt, reason, delay: st.toast(f"Fal request attempt {attempt} failed ({reason}). Retrying in {delay:.1f}s...")
+    )
+    if response.status_code != 200:
+        raise TranscriptionError(f"request failed with status code {response.status_code}: {response.text}")
+    try:
+        return orjson.loads(response.content)["text"]
+    except (orjson.JSONDecodeError, KeyError) as e:
+        raise TranscriptionError(f"Failed to parse Fal API response: {str(e)}")
+
+# Each provider maps to the session state key holding its API key and a call
+# taking (api_key, open file, language) that returns the transcript text
+PROVIDERS = {
+    "OpenAI": ("OPENAI_API_KEY", _openai_call),
+    "Groq": ("GROQ_API_KEY", _groq_call),
+    "Fal": ("FAL_KEY", _fal_call),
+}
+
+def transcribe_audio(api_choice, input_file, language="auto"):
+    """Transcribe a file that fits the upload limit with the selected API, returning (text, elapsed)."""
+    key_name, call = PROVIDERS[api_choice]
+    keys = split_api_keys(st.session_state.get(key_name))
+    if not keys:
+        raise TranscriptionError(f"{api_choice} API key is not set")
+    pool = get_key_pool(api_choice, keys)
     
-    with open(input_file, "rb") as audio_file:
-        start_time = time.time()
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            language=None if language == "auto" else language
-        )
-        end_time = time.time()
+    try:
+        with open_audio(input_file) as file:
+            start_time = time.perf_counter()
+            # A 429 waits out Retry-After, or moves to another key, and resends the file
+            text = retry_rate_limited(pool, file, lambda api_key: call(api_key, file, language))
+            return text, time.perf_counter() - start_time
+    except TranscriptionError as e:
+        raise TranscriptionError(f"{api_choice} transcription error: {str(e)}") from e
+    except requests.exceptions.RequestException as e:
+        raise TranscriptionError(f"Network error during {api_choice} API request: {str(e)}") from e
+    except Exception as e:
+        if "api_key" in str(e).lower() or "api key" in str(e).lower() or "authorization" in str(e).lower():
+            raise TranscriptionError(f"{api_choice} API key error: {str(e)}") from e
+        raise TranscriptionError(f"{api_choice} transcription error: {str(e)}") from e
+
+# Chunk extensions for inputs whose own extension has no ffmpeg muxer; the rest keep theirs
+CHUNK_EXTENSIONS = {'.mpga': '.mp3'}
+
+def chunk_audio(input_file, output_dir, chunk_sec, duration, overlap=2):
+    """Stream-copy an audio file into chunks that each run `overlap` seconds into the next.
     
-    return transcript.text, end_time - start_time
+    Returns the chunk paths in order. The overlap gives words cut at a boundary a second
+    chance to be transcribed whole; merge_overlapping_transcripts removes the repeats.
+    """
+    extension = os.path.splitext(input_file)[1].lower()
+    extension = CHUNK_EXTENSIONS.get(extension, extension)
+    # A chunk starting within `overlap` of the end would lie entirely inside the previous one's
+    # overlap, and could be too short for the APIs to accept
+    starts = [start for start in range(0, math.ceil(duration), chunk_sec) if start == 0 or start + overlap < duration]
+    chunks = []
+    for index, start in enumerate(starts):
+        chunk_path = os.path.join(output_dir, f'part_{index:03d}{extension}')
+        cmd = [get_ffmpeg_path(), '-ss', str(start), '-i', input_file, '-t', str(chunk_sec + overlap),
+               '-vn', '-c', 'copy', '-y', chunk_path]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Failed to split audio into chunks: {result.stderr}")
+        chunks.append(chunk_path)
+    return chunks
+
+def merge_overlapping_transcripts(transcripts, max_overlap_words=20, min_overlap_words=2):
+    """Join chunk transcripts, dropping the words each chunk repeats from the end of the previous one.
+    
+    A single shared word is kept, since it's as likely to be said twice as to be an overlap.
+    """
+    normalize = lambda word: re.sub(r'\W', '', word.lower())
+    merged = []
+    for transcript in transcripts:
+        words = transcript.split()
+        if merged:
+            tail = [normalize(word) for word in merged[-max_overlap_words:]]
+            head = [normalize(word) for word in words[:max_overlap_words]]
+            # Longest run of words ending the previous chunk that also starts this one
+            for size in range(min(len(tail), len(head)), min_overlap_words - 1, -1):
+                if tail[-size:] == head[:size]:
+                    words = words[size:]
+                    break
+        merged.extend(words)
+    return ' '.join(merged)
 
-def transcribe_audio_fal(input_file, language="auto"):
-    if not st.session_state.FAL_KEY:
-        raise ValueError("Fal API key is not set")
+def transcribe_long(api_choice, input_file, language="auto", chunk_sec=600):
+    """Split an oversized audio file into overlapping chunks and transcribe them in parallel.
     
+    The chunks are stream-copied, so nothing is re-encoded and no quality is lost.
+    """
+    start_time = time.perf_counter()
+    size_mb = os.stat(input_file).st_size / (1024 * 1024)
+    duration = get_audio_info(input_file)
+    # Shorten the chunks for high-bitrate files so each one stays under 25MB
+    chunk_sec = max(1, min(chunk_sec, int(duration * 24 / size_mb)))
+    
+    chunk_dir = tempfile.mkdtemp(prefix='whisper_chunks_')
     try:
-        # Make sure proxy settings are not used for this request
-        session = requests.Session()
-        session.trust_env = False  # Don't use environment variables for proxy settings
-            
-        url = "https://fal.run/fal-ai/wizper"
-        headers = {
-            "Authorization": f"Key {st.session_state.FAL_KEY}",
-            "Content-Type": "application/json"
-        }
+        chunks = chunk_audio(input_file, chunk_dir, chunk_sec, duration)
         
-        # Upload the file and get the URL
-        with st.status("Uploading file to temporary storage...") as status:
-            audio_url = upload_to_tmpfiles(input_file)
-            status.update(label="File uploaded successfully. Sending to Fal API...", state="running")
+        # The API helpers read keys from session state, so each worker needs the script context
+        ctx = get_script_run_ctx()
         
-        data = {
-            "audio_url": audio_url,
-            "task": "transcribe",
-            "language": "auto" if language == "auto" else language,
-            "chunk_level": "segment",
-            "version": "3"
-        }
-        
-        start_time = time.time()
-        response = session.post(url, headers=headers, json=data, timeout=120)  # Add timeout
-        end_time = time.time()
+        def transcribe_chunk(chunk):
+            add_script_run_ctx(threading.current_thread(), ctx)
+            return transcribe_audio(api_choice, chunk, language=language)[0]
         
-        if response.status_code == 200:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            transcripts = list(executor.map(transcribe_chunk, chunks))
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    
+    return merge_overlapping_transcripts(transcripts), time.perf_counter() - start_time
+
+def transcribe_with_cache(api_choice, input_file, language="auto", transcribe=transcribe_audio, content_hash=None):
+    """Transcribe with the selected API, reusing the cached transcript for identical audio.
+    
+    Pass the audio's content_hash when the caller already has it, to skip hashing again.
+    """
+    start_time = time.perf_counter()
+    content_hash = content_hash or hash_audio(input_file)
+    cache_key = f"{content_hash}|{api_choice}|{language}"
+    transcript = get_cached_transcript(cache_key)
+    if transcript is None:
+        # Fall back to the saved history, which outlives the cache's LRU limit
+        transcript = find_transcript_by_hash(content_hash, api_choice, language)
+        if transcript is not None:
+            cache_transcript(cache_key, transcript)
+    if transcript is not None:
+        st.session_state.cache_hits += 1
+        return transcript, time.perf_counter() - start_time
+    
+    st.session_state.cache_misses += 1
+    transcript, transcription_time = transcribe(api_choice, input_file, language=language)
+    
+    cache_transcript(cache_key, transcript)
+    return transcript, transcription_time
+
+# Radio option that runs every configured API side by side
+COMPARE_ALL = "All (compare)"
+FASTEST = "Fastest (race)"
+MULTI_API_CHOICES = (COMPARE_ALL, FASTEST)
+
+# OpenAI and Groq take uploads up to 25MB; Fal fetches the file from tmpfiles.org,
+# which accepts up to 100MB, so Fal-only runs can skip compressing or splitting
+UPLOAD_LIMIT_MB = 25
+FAL_UPLOAD_LIMIT_MB = 100
+
+def upload_limit_mb(api_choice):
+    """Return the largest file in MB the selected API can take as-is."""
+    return FAL_UPLOAD_LIMIT_MB if api_choice == "Fal" else UPLOAD_LIMIT_MB
+
+def configured_apis():
+    """Return the APIs that have a key entered, in display order."""
+    return [api for api, (key_name, _) in PROVIDERS.items() if st.session_state.get(key_name)]
+
+def transcribe_selected(api_choice, input_file, language="auto", transcribe=transcribe_audio):
+    """Transcribe with the selected API, or with every configured API in parallel.
+    
+    When comparing, every API's transcript is collected; when racing, the first
+    successful transcript wins and the slower calls are cut loose from the page.
+    Returns ({api: transcript}, {api: error}, elapsed seconds, audio content hash),
+    so the caller can save the results without hashing the audio again. Raises if
+    no API succeeded.
+    """
+    # Hashed once here rather than per API, since each API reads its own copy of a stream
+    content_hash = hash_audio(input_file)
+    if api_choice not in MULTI_API_CHOICES:
+        transcript, transcription_time = transcribe_with_cache(
+            api_choice, input_file, language=language, transcribe=transcribe, content_hash=content_hash
+        )
+        return {api_choice: transcript}, {}, transcription_time, content_hash
+    
+    start_time = time.perf_counter()
+    apis = configured_apis()
+    ctx = get_script_run_ctx()
+    threads = {}
+    
+    def run(api):
+        threads[api] = threading.current_thread()
+        add_script_run_ctx(threads[api], ctx)
+        # In-memory streams are shared, so give each API its own copy to read
+        audio = input_file if isinstance(input_file, (str, os.PathLike)) else io.BytesIO(input_file.getvalue())
+        if audio is not input_file:
+            audio.name = input_file.name
+        return transcribe_with_cache(api, audio, language=language, transcribe=transcribe, content_hash=content_hash)[0]
+    
+    results, errors = {}, {}
+    executor = ThreadPoolExecutor(max_workers=len(apis))
+    futures = {executor.submit(run, api): api for api in apis}
+    try:
+        for future in as_completed(futures):
+            api = futures[future]
             try:
-                result = response.json()
-                return result["text"], end_time - start_time
-            except (json.JSONDecodeError, KeyError) as e:
-                raise Exception(f"Failed to parse Fal API response: {str(e)}")
-        else:
-            raise Exception(f"Fal API request failed with status code {response.status_code}: {response.text}")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Network error during Fal API request: {str(e)}")
-    except Exception as e:
-        if "API key" in str(e) or "authorization" in str(e).lower():
-            raise ValueError(f"Fal API key error: {str(e)}")
-        else:
-            raise Exception(f"Fal transcription error: {str(e)}")
+                results[api] = future.result()
+            except Exception as e:
+                errors[api] = e
+                continue
+            if api_choice == FASTEST:
+                # Detach the losers from this script run, which is about to end: they can't draw
+                # into the page or read its session state, so a call that hasn't been sent yet
+                # fails for want of a key instead of spending quota, and its error is never read
+                for loser, thread in threads.items():
+                    if loser != api:
+                        setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+                break
+    finally:
+        # A race doesn't wait for the losers; calls already sent finish in the background and still fill the cache
+        executor.shutdown(wait=api_choice != FASTEST, cancel_futures=True)
+    
+    if not results:
+        raise next(iter(errors.values()))
+    # Keep comparisons in display order rather than completion order
+    results = {api: results[api] for api in apis if api in results}
+    return results, errors, time.perf_counter() - start_time, content_hash
+
+PROXY_ERROR_HINT = """
+Proxy configuration issue detected! Try one of these solutions:
+
+1. Run the application without proxy environment variables:
+   ```
+   env -u HTTP_PROXY -u HTTPS_PROXY -u http_proxy -u https_proxy streamlit run whisper_webui.py
+   ```
+   
+2. Update your packages:
+   ```
+   pip install -U openai httpx
+   ```
+   
+3. Restart the application after clearing environment variables.
+"""
+
+# Checked in order; the first pattern found anywhere in the error message picks the hint
+ERROR_HINTS = [
+    (re.compile(r'prox(?:y|ies)', re.I), PROXY_ERROR_HINT),
+    (re.compile(r'api key', re.I), "Please check that your API key is correct and has been entered properly."),
+    (re.compile(r'rate limit|quota', re.I), "You may have hit a rate limit or quota on your API key. Please check your usage."),
+    (re.compile(r'network|connection|timeout', re.I), "Network error detected. Please check your internet connection."),
+    (re.compile(r'(?=.*file)(?=.*(?:not found|access))', re.I | re.S), "File access error. The temporary file may have been deleted or is inaccessible."),
+    (re.compile(r'format|codec', re.I), "Audio format error. The file may be corrupted or in an unsupported format."),
+    (re.compile(r'ffmpeg', re.I), "FFmpeg error. Please ensure FFmpeg is properly installed on your system."),
+    (re.compile(r'memory', re.I), "Memory error. The file may be too large to process with available memory."),
+]
+
+def show_error_hint(error_msg):
+    """Show advice for the first known kind of failure mentioned in an error message."""
+    for pattern, hint in ERROR_HINTS:
+        if pattern.search(error_msg):
+            st.error(hint)
+            return
+
+def show_transcription_results(results, errors):
+    """Make the first successful transcript current and keep the rest for comparison."""
+    for api, error in errors.items():
+        st.warning(f"{api} transcription failed: {str(error)}")
+    st.session_state.transcript = next(iter(results.values()))
+    st.session_state.comparison = results if len(results) > 1 else {}
+
+def run_with_progress(status, label, fn, *args, **kwargs):
+    """Run a blocking call on the worker pool, showing the elapsed time on the status until it finishes."""
+    # Let the worker thread read session state and render into the page
+    ctx = get_script_run_ctx()
+    
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    
+    future = EXECUTOR.submit(run)
+    start_time = time.perf_counter()
+    while not future.done():
+        status.update(label=f"{label} ({time.perf_counter() - start_time:.1f}s elapsed)", state="running")
+        time.sleep(0.25)
+    return future.result()
+
+def download_with_progress(status, progress_placeholder, download, url, **kwargs):
+    """Run a yt-dlp download on the worker pool, drawing its progress on the script thread.
+    
+    The progress hook runs in the download thread, so it only queues byte counts.
+    """
+    updates = queue.Queue()
+    
+    def progress_hook(d):
+        if d['status'] == 'downloading':
+            updates.put((d.get('downloaded_bytes', 0), d.get('total_bytes') or d.get('total_bytes_estimate') or 0))
+    
+    future = EXECUTOR.submit(download, url, progress_hook, **kwargs)
+    while not future.done():
+        time.sleep(0.25)
+        # Only the latest update matters
+        latest = None
+        while not updates.empty():
+            latest = updates.get_nowait()
+        if latest and latest[1] > 0:
+            downloaded, total_bytes = latest
+            progress = min(downloaded / total_bytes, 1.0) * 100
+            progress_placeholder.progress(int(progress))
+            status.update(label=f"Downloading: {progress:.1f}% of {total_bytes/1024/1024:.1f} MB", state="running")
+    return future.result()
 
 def save_transcript_to_file(transcript, filename):
     try:
@@ -336,131 +1148,188 @@ def save_transcript_to_file(transcript, filename):
         st.error(f"Failed to save transcript: {str(e)}")
         return False
 
+def copy_to_clipboard(text):
+    """Copy text to the visitor's clipboard from the browser, rather than the server's with pyperclip"""
+    # Escape "</" so a transcript containing "</script>" can't end the script tag early
+    payload = json.dumps(text).replace("</", "<\\/")
+    components.html(f"<script>navigator.clipboard.writeText({payload});</script>", height=0)
+
+# Page styling, built once at import instead of on every rerun.
+# Streamlit drops elements a rerun doesn't emit again, so these are still sent each run.
+LOGO_HTML = """
+<style>
+.logo-container {
+    display: flex;
+    align-items: center;
+    margin-bottom: 20px;
+}
+.logo-text {
+    font-size: 2.5rem;
+    font-weight: bold;
+    background: linear-gradient(90deg, #1E88E5 0%, #9C27B0 100%);
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+    margin-left: 10px;
+}
+.logo-icon {
+    font-size: 2.5rem;
+    color: #1E88E5;
+}
+</style>
+<div class="logo-container">
+    <div class="logo-icon">🎙️</div>
+    <div class="logo-text">Whisper Web UI</div>
+</div>
+"""
+
+CUSTOM_CSS = """
+<style>
+.stButton button {
+    background-color: #4CAF50;
+    color: white;
+    border-radius: 8px;
+    border: none;
+    padding: 8px 16px;
+    transition: all 0.3s;
+}
+.stButton button:hover {
+    background-color: #45a049;
+    box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+}
+.success-message {
+    padding: 10px;
+    background-color: #dff0d8;
+    border-left: 5px solid #3c763d;
+    color: #3c763d;
+    margin: 10px 0;
+    border-radius: 4px;
+}
+.file-formats {
+    font-size: 0.8rem;
+    color: #666;
+    margin-top: -15px;
+    margin-bottom: 10px;
+}
+.dark-mode .file-formats {
+    color: #aaa;
+}
+.dark-mode {
+    background-color: #121212;
+    color: #f0f0f0;
+}
+.dark-mode .stTextInput input, .dark-mode .stTextArea textarea {
+    background-color: #2d2d2d;
+    color: #f0f0f0;
+    border-color: #444;
+}
+.dark-mode .stButton button {
+    background-color: #388e3c;
+}
+.dark-mode .stButton button:hover {
+    background-color: #2e7d32;
+}
+.dark-mode .success-message {
+    background-color: #1b5e20;
+    color: #a5d6a7;
+    border-left: 5px solid #4caf50;
+}
+.stTabs [data-baseweb="tab-list"] {
+    gap: 24px;
+}
+.stTabs [data-baseweb="tab"] {
+    height: 50px;
+    white-space: pre-wrap;
+    border-radius: 4px 4px 0 0;
+    gap: 1px;
+    padding-top: 10px;
+    padding-bottom: 10px;
+}
+.stTabs [aria-selected="true"] {
+    background-color: rgba(128, 128, 128, 0.1);
+    border-bottom: 2px solid #4CAF50;
+}
+</style>
+"""
+
+DARK_MODE_CSS = """
+<style>
+.stApp {
+    background-color: #121212;
+    color: #f0f0f0;
+}
+</style>
+"""
+
+# Confirmation banner styled by .success-message, filled in with substitute(msg=...)
+SUCCESS_MESSAGE_HTML = Template('<div class="success-message">✅ $msg</div>')
+
 def add_logo():
     # Create a simple logo with text
-    st.markdown("""
-    <style>
-    .logo-container {
-        display: flex;
-        align-items: center;
-        margin-bottom: 20px;
-    }
-    .logo-text {
-        font-size: 2.5rem;
-        font-weight: bold;
-        background: linear-gradient(90deg, #1E88E5 0%, #9C27B0 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        margin-left: 10px;
-    }
-    .logo-icon {
-        font-size: 2.5rem;
-        color: #1E88E5;
-    }
-    </style>
-    <div class="logo-container">
-        <div class="logo-icon">🎙️</div>
-        <div class="logo-text">Whisper Web UI</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-def apply_custom_css():
-    # Apply custom CSS for better styling
-    st.markdown("""
-    <style>
-    .stButton button {
-        background-color: #4CAF50;
-        color: white;
-        border-radius: 8px;
-        border: none;
-        padding: 8px 16px;
-        transition: all 0.3s;
-    }
-    .stButton button:hover {
-        background-color: #45a049;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-    }
-    .success-message {
-        padding: 10px;
-        background-color: #dff0d8;
-        border-left: 5px solid #3c763d;
-        color: #3c763d;
-        margin: 10px 0;
-        border-radius: 4px;
-    }
-    .file-formats {
-        font-size: 0.8rem;
-        color: #666;
-        margin-top: -15px;
-        margin-bottom: 10px;
-    }
-    .dark-mode .file-formats {
-        color: #aaa;
-    }
-    .dark-mode {
-        background-color: #121212;
-        color: #f0f0f0;
-    }
-    .dark-mode .stTextInput input, .dark-mode .stTextArea textarea {
-        background-color: #2d2d2d;
-        color: #f0f0f0;
-        border-color: #444;
-    }
-    .dark-mode .stButton button {
-        background-color: #388e3c;
-    }
-    .dark-mode .stButton button:hover {
-        background-color: #2e7d32;
-    }
-    .dark-mode .success-message {
-        background-color: #1b5e20;
-        color: #a5d6a7;
-        border-left: 5px solid #4caf50;
-    }
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 24px;
-    }
-    .stTabs [data-baseweb="tab"] {
-        height: 50px;
-        white-space: pre-wrap;
-        border-radius: 4px 4px 0 0;
-        gap: 1px;
-        padding-top: 10px;
-        padding-bottom: 10px;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: rgba(128, 128, 128, 0.1);
-        border-bottom: 2px solid #4CAF50;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(LOGO_HTML, unsafe_allow_html=True)
+
+def apply_custom_css(dark_mode=False):
+    # Apply custom CSS for better styling, with the dark mode overrides in the same element
+    st.markdown(CUSTOM_CSS + DARK_MODE_CSS if dark_mode else CUSTOM_CSS, unsafe_allow_html=True)
+
+# Compiled once instead of on every rerun; the only capture group is the 11-character video ID
+YOUTUBE_URL_RE = re.compile(
+    r'(?:https?://)?(?:www\.)?'
+    r'(?:youtube|youtu|youtube-nocookie)\.(?:com|be)/'
+    r'(?:watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})',
+    re.ASCII
+)
 
 def is_valid_youtube_url(url):
     """Check if the URL is a valid YouTube URL."""
-    youtube_regex = (
-        r'(https?://)?(www\.)?'
-        r'(youtube|youtu|youtube-nocookie)\.(com|be)/'
-        r'(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
-    )
-    match = re.match(youtube_regex, url)
-    return bool(match)
+    return bool(YOUTUBE_URL_RE.search(url))
 
 def get_youtube_video_id(url):
     """Extract the video ID from a YouTube URL."""
-    youtube_regex = (
-        r'(https?://)?(www\.)?'
-        r'(youtube|youtu|youtube-nocookie)\.(com|be)/'
-        r'(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
-    )
-    match = re.match(youtube_regex, url)
-    if match:
-        return match.group(6)
+    match = YOUTUBE_URL_RE.search(url)
+    return match.group(1) if match else None
+
+AUDIO_DOWNLOAD_EXTENSIONS = ('.mp3', '.m4a', '.wav', '.aac')
+
+@st.cache_resource
+def get_workspace_root():
+    """Create the process-wide parent of every session's workspace, removed when the process exits."""
+    root = tempfile.mkdtemp(prefix='whisper_webui_')
+    atexit.register(shutil.rmtree, root, ignore_errors=True)
+    return root
+
+def get_download_dir(name):
+    """Return a directory for one video inside this session's workspace, creating it if needed.
+    
+    The workspace lives under the process-wide root, so a fallback download can
+    pick up whatever an earlier attempt already produced.
+    """
+    if 'workspace' not in st.session_state:
+        st.session_state.workspace = tempfile.mkdtemp(dir=get_workspace_root())
+    download_dir = os.path.join(st.session_state.workspace, name)
+    os.makedirs(download_dir, exist_ok=True)
+    return download_dir
+
+def remove_download_dir(download_dir):
+    """Remove one video's directory, and its session workspace once nothing else is left in it."""
+    shutil.rmtree(download_dir, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(download_dir))
+    except OSError:
+        # Another download of this session is still using the workspace
+        pass
+
+def find_downloaded_audio(download_dir):
+    """Return an audio file already downloaded into the directory, if any."""
+    for file in sorted(os.listdir(download_dir)):
+        if file.endswith(AUDIO_DOWNLOAD_EXTENSIONS):
+            return os.path.join(download_dir, file)
     return None
 
-def download_youtube_audio(url, progress_callback=None):
+def download_youtube_audio(url, progress_callback=None, download_dir=None):
     """Download audio from a YouTube video."""
-    # Create a temporary directory to store files
-    temp_dir = tempfile.mkdtemp()
+    import yt_dlp  # Imported on first download; it is slow to load
+    # Download into the given directory, or a fresh temporary one
+    temp_dir = download_dir or tempfile.mkdtemp()
     temp_base = os.path.join(temp_dir, "youtube_audio")
     output_file = f"{temp_base}.mp3"
     
@@ -497,9 +1366,9 @@ def download_youtube_audio(url, progress_callback=None):
             return expected_output
             
         # If the expected file doesn't exist, look for any audio file in the temp directory
-        for file in os.listdir(temp_dir):
-            if file.endswith(('.mp3', '.m4a', '.wav', '.aac')):
-                return os.path.join(temp_dir, file)
+        downloaded = find_downloaded_audio(temp_dir)
+        if downloaded:
+            return downloaded
                 
         # If we still don't have a file, try a direct approach with ffmpeg
         video_id = get_youtube_video_id(url)
@@ -513,23 +1382,26 @@ def download_youtube_audio(url, progress_callback=None):
                 
         raise Exception("No audio file was downloaded")
     except Exception as e:
-        # Clean up temp directory on error
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        # Clean up temp directory on error, leaving a workspace directory for the fallback to reuse
+        if not download_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
         raise Exception(f"Failed to download YouTube video: {str(e)}")
 
+@st.cache_resource
 def is_ytdlp_installed():
-    """Check if yt-dlp is installed and working properly."""
-    try:
-        result = subprocess.run(['yt-dlp', '--version'], capture_output=True, text=True)
-        return result.returncode == 0
-    except FileNotFoundError:
-        return False
+    """Check if yt-dlp is installed, resolving it on PATH once per process."""
+    return shutil.which('yt-dlp') is not None
 
-def download_youtube_audio_direct(url):
+def download_youtube_audio_direct(url, download_dir=None):
     """Download audio from a YouTube video using direct command-line approach."""
-    temp_dir = tempfile.mkdtemp()
+    temp_dir = download_dir or tempfile.mkdtemp()
     output_file = os.path.join(temp_dir, "audio.mp3")
     
+    # Reuse audio an earlier attempt already finished instead of downloading it again
+    downloaded = find_downloaded_audio(temp_dir)
+    if downloaded:
+        return downloaded
+    
     # Try yt-dlp first
     try:
         cmd = ['yt-dlp', '-x', '--audio-format', 'mp3', '-o', output_file, url]
@@ -557,7 +1429,7 @@ def download_youtube_audio_direct(url):
         
         if stream_url:
             # Download with ffmpeg
-            cmd = ['ffmpeg', '-i', stream_url, '-acodec', 'mp3', '-y', output_file]
+            cmd = [get_ffmpeg_path(), '-i', stream_url, '-acodec', 'mp3', '-y', output_file]
             subprocess.run(cmd, capture_output=True, check=True)
             if os.path.exists(output_file):
                 return output_file
@@ -568,12 +1440,15 @@ def download_youtube_audio_direct(url):
     shutil.rmtree(temp_dir, ignore_errors=True)
     raise Exception("Failed to download YouTube audio using all available methods")
 
+# TikTok URL patterns, compiled once
+TIKTOK_URL_RE = re.compile(r'(https?://)?(www\.|vm\.|m\.)?tiktok\.com/(@[\w.-]+/video/\d+|v/\d+|[A-Za-z0-9]+/?)')
+TIKTOK_STANDARD_RE = re.compile(r'tiktok\.com/@[\w.-]+/video/(\d+)')
+TIKTOK_V_RE = re.compile(r'tiktok\.com/v/(\d+)')
+TIKTOK_SHORT_RE = re.compile(r'tiktok\.com/([A-Za-z0-9]+)/?$')
+
 def is_valid_tiktok_url(url):
     """Check if the URL is a valid TikTok URL."""
-    # Standard TikTok URL pattern
-    tiktok_regex = r'(https?://)?(www\.|vm\.|m\.)?tiktok\.com/(@[\w.-]+/video/\d+|v/\d+|[A-Za-z0-9]+/?)'
-    match = re.match(tiktok_regex, url)
-    return bool(match)
+    return bool(TIKTOK_URL_RE.match(url))
 
 def get_tiktok_video_id(url):
     """Extract the video ID from a TikTok URL.
@@ -584,31 +1459,29 @@ def get_tiktok_video_id(url):
     - https://m.tiktok.com/v/1234567890123456789.html
     """
     # Try to extract from standard format
-    standard_pattern = r'tiktok\.com/@[\w.-]+/video/(\d+)'
-    match = re.search(standard_pattern, url)
+    match = TIKTOK_STANDARD_RE.search(url)
     if match:
         return match.group(1)
     
     # Try to extract from /v/ format
-    v_pattern = r'tiktok\.com/v/(\d+)'
-    match = re.search(v_pattern, url)
+    match = TIKTOK_V_RE.search(url)
     if match:
         return match.group(1)
     
     # For shortened URLs, we'll just use the last path component
     # This isn't a real ID but helps with identification
-    short_pattern = r'tiktok\.com/([A-Za-z0-9]+)/?$'
-    match = re.search(short_pattern, url)
+    match = TIKTOK_SHORT_RE.search(url)
     if match:
         return match.group(1)
     
     return None
 
-def download_tiktok_audio(url, progress_callback=None):
+def download_tiktok_audio(url, progress_callback=None, download_dir=None):
     """Download audio from a TikTok video using yt-dlp."""
+    import yt_dlp  # Imported on first download; it is slow to load
     # This function is very similar to download_youtube_audio
     # but with some TikTok-specific configurations
-    temp_dir = tempfile.mkdtemp()
+    temp_dir = download_dir or tempfile.mkdtemp()
     temp_base = os.path.join(temp_dir, "tiktok_audio")
     output_file = f"{temp_base}.mp3"
     
@@ -653,9 +1526,9 @@ def download_tiktok_audio(url, progress_callback=None):
             return expected_output
             
         # If the expected file doesn't exist, look for any audio file in the temp directory
-        for file in os.listdir(temp_dir):
-            if file.endswith(('.mp3', '.m4a', '.wav', '.aac')):
-                return os.path.join(temp_dir, file)
+        downloaded = find_downloaded_audio(temp_dir)
+        if downloaded:
+            return downloaded
         
         # If we still don't have a file, try a direct approach
         video_id = get_tiktok_video_id(url)
@@ -668,16 +1541,22 @@ def download_tiktok_audio(url, progress_callback=None):
                 
         raise Exception("No audio file was downloaded")
     except Exception as e:
-        # Clean up temp directory on error
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        # Clean up temp directory on error, leaving a workspace directory for the fallback to reuse
+        if not download_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
         raise Exception(f"Failed to download TikTok video: {str(e)}")
 
-def download_tiktok_audio_direct(url):
+def download_tiktok_audio_direct(url, download_dir=None):
     """Download audio from a TikTok video using direct command-line approach."""
     # Similar to download_youtube_audio_direct but for TikTok
-    temp_dir = tempfile.mkdtemp()
+    temp_dir = download_dir or tempfile.mkdtemp()
     output_file = os.path.join(temp_dir, "audio.mp3")
     
+    # Reuse audio an earlier attempt already finished instead of downloading it again
+    downloaded = find_downloaded_audio(temp_dir)
+    if downloaded:
+        return downloaded
+    
     # Try yt-dlp first
     try:
         cmd = ['yt-dlp', '-x', '--audio-format', 'mp3', '-o', output_file, url]
@@ -702,7 +1581,80 @@ def download_tiktok_audio_direct(url):
     shutil.rmtree(temp_dir, ignore_errors=True)
     raise Exception("Failed to download TikTok audio using all available methods")
 
+def transcribe_online_video(status, url, platform, video_title, download_name, download, download_direct, api_choice, language):
+    """Download a YouTube or TikTok video's audio, transcribe it and save the results to history.
+    
+    download runs on the worker pool with a progress bar; download_direct is the
+    fallback when it fails. platform names the site in messages and, lowercased,
+    is the saved source type.
+    """
+    try:
+        status.update(label=f"Downloading audio from {platform}...", state="running")
+        
+        # Download on the worker pool while this thread draws the progress
+        progress_placeholder = st.empty()
+        download_dir = get_download_dir(download_name)
+        try:
+            audio_file = download_with_progress(status, progress_placeholder, download, url, download_dir=download_dir)
+            status.update(label="Download complete!", state="running")
+        except Exception as e:
+            status.update(label="Primary download method failed. Trying alternative method...", state="running")
+            try:
+                audio_file = download_direct(url, download_dir=download_dir)
+                status.update(label="Download complete using alternative method!", state="running")
+            except Exception as e2:
+                raise Exception(f"All download methods failed. Primary error: {str(e)}. Secondary error: {str(e2)}")
+        
+        # Oversized downloads are split into stream-copied segments instead of re-encoded
+        transcribe = transcribe_audio
+        audio_file_size = os.stat(audio_file).st_size / (1024 * 1024)  # Audio file size in MB
+        if audio_file_size > upload_limit_mb(api_choice):
+            status.update(label=f"File size exceeds {upload_limit_mb(api_choice)}MB. Transcribing in parallel segments.", state="running")
+            transcribe = transcribe_long
+        else:
+            status.update(label="File size is within the allowed limit. No compression needed.", state="running")
+        
+        # Transcribe the audio
+        status.update(label=f"Transcribing audio using {api_choice} API...", state="running")
+        try:
+            results, errors, st.session_state.transcription_time, content_hash = run_with_progress(
+                status,
+                f"Transcribing audio using {api_choice} API...",
+                transcribe_selected,
+                api_choice,
+                audio_file,
+                language=language,
+                transcribe=transcribe
+            )
+            show_transcription_results(results, errors)
+            
+            # Save to database; the duration probe is cached from chunking when it ran
+            duration = try_get_audio_info(audio_file)
+            try:
+                # One row per API result, written in a single transaction; wait so a failed save is reported
+                wait_for_write(save_transcriptions_bulk(
+                    [(video_title, platform.lower(), api_used, language, duration, transcript) for api_used, transcript in results.items()],
+                    content_hash=content_hash
+                ))
+            except Exception as db_error:
+                st.error(f"Failed to save to history database: {str(db_error)}")
+            
+            status.update(label=f"Transcription complete! Time taken: {st.session_state.transcription_time:.2f} seconds", state="complete")
+        except Exception as e:
+            error_msg = str(e)
+            st.error(f"Transcription failed: {error_msg}")
+            show_error_hint(error_msg)
+            status.update(label="Transcription failed.", state="error")
+        
+        # Cleanup; the download directory also holds any partial files
+        remove_download_dir(download_dir)
+    except Exception as e:
+        st.error(f"Failed to process {platform} video: {str(e)}")
+        status.update(label=f"Failed to process {platform} video.", state="error")
+
 def main():
+    ensure_db()
+    
     # Initialize session state variables
     if 'transcript' not in st.session_state:
         st.session_state.transcript = ""
@@ -712,8 +1664,11 @@ def main():
         st.session_state.fal_disclaimer_accepted = False
     if 'dark_mode' not in st.session_state:
         st.session_state.dark_mode = False
-    if 'history' not in st.session_state:
-        st.session_state.history = []
+    if 'comparison' not in st.session_state:
+        st.session_state.comparison = {}
+    if 'cache_hits' not in st.session_state:
+        st.session_state.cache_hits = 0
+        st.session_state.cache_misses = 0
     if 'OPENAI_API_KEY' not in st.session_state:
         st.session_state.OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
     if 'GROQ_API_KEY' not in st.session_state:
@@ -721,19 +1676,8 @@ def main():
     if 'FAL_KEY' not in st.session_state:
         st.session_state.FAL_KEY = os.environ.get("FAL_KEY", "")
     
-    # Apply dark mode if enabled
-    if st.session_state.dark_mode:
-        st.markdown("""
-        <style>
-        .stApp {
-            background-color: #121212;
-            color: #f0f0f0;
-        }
-        </style>
-        """, unsafe_allow_html=True)
-    
-    # Apply custom CSS
-    apply_custom_css()
+    # Apply custom CSS, plus dark mode if enabled
+    apply_custom_css(st.session_state.dark_mode)
     
     # Create sidebar
     with st.sidebar:
@@ -748,14 +1692,14 @@ def main():
                 "OpenAI API Key",
                 value=st.session_state.OPENAI_API_KEY,
                 type="password",
-                help="Enter your OpenAI API key. Get one at https://platform.openai.com/api-keys"
+                help="Enter your OpenAI API key, or several separated by commas to spread requests across them. Get one at https://platform.openai.com/api-keys"
             )
             
             st.session_state.GROQ_API_KEY = st.text_input(
                 "Groq API Key (Optional)",
                 value=st.session_state.GROQ_API_KEY,
                 type="password",
-                help="Enter your Groq API key. Get one at https://console.groq.com/keys"
+                help="Enter your Groq API key, or several separated by commas to spread requests across them. Get one at https://console.groq.com/keys"
             )
             
             st.session_state.FAL_KEY = st.text_input(
@@ -786,14 +1730,30 @@ def main():
             index=0
         )
         
-        # Recent transcriptions
-        if st.session_state.history:
+        # Transcript cache
+        st.subheader("Transcript Cache")
+        lookups = st.session_state.cache_hits + st.session_state.cache_misses
+        hit_rate = st.session_state.cache_hits / lookups if lookups else 0
+        st.caption(f"{st.session_state.cache_hits} hits, {st.session_state.cache_misses} misses ({hit_rate:.0%} hit rate)")
+        if st.button("Clear cache"):
+            try:
+                wait_for_write(clear_transcript_cache())  # Wait for the writer so the next lookup misses
+            except Exception as e:
+                st.error(f"Failed to clear the transcript cache: {str(e)}")
+            else:
+                st.session_state.cache_hits = 0
+                st.session_state.cache_misses = 0
+                st.success("Transcript cache cleared.")
+        
+        # Recent transcriptions, read from the same database as the History tab
+        recent = cached_history(limit=5)
+        if recent:
             st.subheader("Recent Transcriptions")
-            for i, (timestamp, filename, transcript_snippet) in enumerate(st.session_state.history[-5:]):
+            for id, timestamp, filename, *_, transcript, favorite, total in recent:
                 with st.expander(f"{filename} ({timestamp})"):
-                    st.write(transcript_snippet[:100] + "..." if len(transcript_snippet) > 100 else transcript_snippet)
-                    if st.button(f"Load", key=f"load_{i}"):
-                        st.session_state.transcript = transcript_snippet
+                    st.write(transcript[:100] + "..." if len(transcript) > 100 else transcript)
+                    if st.button(f"Load", key=f"recent_load_{id}"):
+                        st.session_state.transcript = transcript
                         st.rerun()
     
     # Main content
@@ -840,7 +1800,11 @@ def main():
         if st.session_state.FAL_KEY:
             api_options.append("Fal")
             
+        if len(configured_apis()) > 1:
+            api_options.extend(MULTI_API_CHOICES)
+            
         api_choice = st.radio("Select API for transcription:", api_options)
+        uses_fal = api_choice == "Fal" or (api_choice in MULTI_API_CHOICES and "Fal" in configured_apis())
 
         # Disable transcription if required API key is missing
         api_key_missing = (
@@ -853,7 +1817,7 @@ def main():
             st.warning(f"Please enter your {api_choice} API key to use this option.")
 
         # Fal API disclaimer
-        if api_choice == "Fal" and not st.session_state.fal_disclaimer_accepted:
+        if uses_fal and not st.session_state.fal_disclaimer_accepted:
             with st.expander("⚠️ Important Disclaimer for Fal API Usage", expanded=True):
                 st.warning(
                     "By using the Fal API option, you agree to the following:\n\n"
@@ -865,10 +1829,10 @@ def main():
                 )
                 st.session_state.fal_disclaimer_accepted = st.checkbox("I understand and agree to proceed")
 
-        if (api_choice != "Fal" or st.session_state.fal_disclaimer_accepted) and not api_key_missing:
+        if (not uses_fal or st.session_state.fal_disclaimer_accepted) and not api_key_missing:
             st.subheader("Upload Audio or Video File")
-            uploaded_file = st.file_uploader("Choose an audio or video file", type=["mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm", "avi", "mov", "mkv", "flv", "wmv"])
-            st.markdown('<p class="file-formats">Supported formats: MP3, MP4, MPEG, MPGA, M4A, WAV, WEBM, AVI, MOV, MKV, FLV, WMV</p>', unsafe_allow_html=True)
+            uploaded_file = st.file_uploader("Choose an audio or video file", type=["mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm", "avi", "mov", "mkv", "flv", "wmv", "m4v"])
+            st.markdown('<p class="file-formats">Supported formats: MP3, MP4, MPEG, MPGA, M4A, WAV, WEBM, AVI, MOV, MKV, FLV, WMV, M4V</p>', unsafe_allow_html=True)
 
             # Add YouTube URL input
             st.subheader("Or Transcribe from YouTube")
@@ -899,108 +1863,15 @@ def main():
                     
                     if youtube_process_button:
                         with st.status("Processing YouTube video...", expanded=True) as status:
-                            try:
-                                # Download YouTube audio
-                                status.update(label="Downloading audio from YouTube...", state="running")
-                                
-                                # Define progress callback
-                                progress_placeholder = st.empty()
-                                
-                                def yt_progress_hook(d):
-                                    if d['status'] == 'downloading':
-                                        try:
-                                            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                                            downloaded = d.get('downloaded_bytes', 0)
-                                            if total_bytes > 0:
-                                                progress = (downloaded / total_bytes) * 100
-                                                progress_placeholder.progress(int(progress))
-                                                status.update(label=f"Downloading: {progress:.1f}% of {total_bytes/1024/1024:.1f} MB", state="running")
-                                        except:
-                                            pass
-                                
-                                # Download the audio
-                                try:
-                                    audio_file = download_youtube_audio(youtube_url, yt_progress_hook)
-                                    status.update(label="Download complete!", state="running")
-                                except Exception as e:
-                                    status.update(label="Primary download method failed. Trying alternative method...", state="running")
-                                    try:
-                                        audio_file = download_youtube_audio_direct(youtube_url)
-                                        status.update(label="Download complete using alternative method!", state="running")
-                                    except Exception as e2:
-                                        raise Exception(f"All download methods failed. Primary error: {str(e)}. Secondary error: {str(e2)}")
-                                
-                                # Check if compression is needed
-                                audio_file_size = os.path.getsize(audio_file) / (1024 * 1024)  # Audio file size in MB
-                                if audio_file_size > 25:
-                                    status.update(label="File size exceeds 25MB. Compressing...", state="running")
-                                    input_file = compress_audio(audio_file)
-                                    status.update(label="Compression complete.", state="running")
-                                else:
-                                    status.update(label="File size is within the allowed limit. No compression needed.", state="running")
-                                    input_file = audio_file
-                                
-                                # Transcribe the audio
-                                status.update(label=f"Transcribing audio using {api_choice} API...", state="running")
-                                try:
-                                    if api_choice == "OpenAI":
-                                        st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_openai(
-                                            input_file, 
-                                            language=selected_language
-                                        )
-                                    elif api_choice == "Groq":
-                                        st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_groq(
-                                            input_file,
-                                            language=selected_language
-                                        )
-                                    else:  # Fal
-                                        st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_fal(
-                                            input_file,
-                                            language=selected_language
-                                        )
-                                    
-                                    # Add to history
-                                    video_title = f"YouTube: {video_id}"
-                                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-                                    st.session_state.history.append((timestamp, video_title, st.session_state.transcript))
-                                    # Keep only the last 10 items
-                                    st.session_state.history = st.session_state.history[-10:]
-                                    
-                                    # Save to database
-                                    try:
-                                        # Get duration if available
-                                        duration = None
-                                        try:
-                                            duration = get_audio_info(input_file)
-                                        except:
-                                            pass
-                                            
-                                        save_transcription(
-                                            source_name=video_title,
-                                            source_type="youtube",
-                                            api_used=api_choice,
-                                            language=selected_language,
-                                            duration=duration,
-                                            transcript=st.session_state.transcript
-                                        )
-                                    except Exception as db_error:
-                                        st.warning(f"Failed to save to history database: {str(db_error)}")
-                                    
-                                    status.update(label=f"Transcription complete! Time taken: {st.session_state.transcription_time:.2f} seconds", state="complete")
-                                except Exception as e:
-                                    error_msg = str(e)
-                                    st.error(f"Transcription failed: {error_msg}")
-                                    status.update(label="Transcription failed.", state="error")
-                                
-                                # Cleanup
-                                if os.path.exists(audio_file):
-                                    os.unlink(audio_file)
-                                if 'input_file' in locals() and input_file != audio_file and os.path.exists(input_file):
-                                    os.unlink(input_file)
-                                    
-                            except Exception as e:
-                                st.error(f"Failed to process YouTube video: {str(e)}")
-                                status.update(label="Failed to process YouTube video.", state="error")
+                            transcribe_online_video(
+                                status, youtube_url, "YouTube",
+                                video_title=f"YouTube: {video_id}",
+                                download_name=f"youtube_{video_id}",
+                                download=download_youtube_audio,
+                                download_direct=download_youtube_audio_direct,
+                                api_choice=api_choice,
+                                language=selected_language
+                            )
 
             # Add TikTok URL input
             st.subheader("Or Transcribe from TikTok")
@@ -1019,110 +1890,17 @@ def main():
                 tiktok_process_button = st.button("📱 Transcribe TikTok Video", use_container_width=True)
                 
                 if tiktok_process_button:
+                    video_id = get_tiktok_video_id(tiktok_url)
                     with st.status("Processing TikTok video...", expanded=True) as status:
-                        try:
-                            # Download TikTok audio
-                            status.update(label="Downloading audio from TikTok...", state="running")
-                            
-                            # Define progress callback
-                            progress_placeholder = st.empty()
-                            
-                            def tiktok_progress_hook(d):
-                                if d['status'] == 'downloading':
-                                    try:
-                                        total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                                        downloaded = d.get('downloaded_bytes', 0)
-                                        if total_bytes > 0:
-                                            progress = (downloaded / total_bytes) * 100
-                                            progress_placeholder.progress(int(progress))
-                                            status.update(label=f"Downloading: {progress:.1f}% of {total_bytes/1024/1024:.1f} MB", state="running")
-                                    except:
-                                        pass
-                            
-                            # Download the audio
-                            try:
-                                audio_file = download_tiktok_audio(tiktok_url, tiktok_progress_hook)
-                                status.update(label="Download complete!", state="running")
-                            except Exception as e:
-                                status.update(label="Primary download method failed. Trying alternative method...", state="running")
-                                try:
-                                    audio_file = download_tiktok_audio_direct(tiktok_url)
-                                    status.update(label="Download complete using alternative method!", state="running")
-                                except Exception as e2:
-                                    raise Exception(f"All download methods failed. Primary error: {str(e)}. Secondary error: {str(e2)}")
-                            
-                            # Check if compression is needed
-                            audio_file_size = os.path.getsize(audio_file) / (1024 * 1024)  # Audio file size in MB
-                            if audio_file_size > 25:
-                                status.update(label="File size exceeds 25MB. Compressing...", state="running")
-                                input_file = compress_audio(audio_file)
-                                status.update(label="Compression complete.", state="running")
-                            else:
-                                status.update(label="File size is within the allowed limit. No compression needed.", state="running")
-                                input_file = audio_file
-                            
-                            # Transcribe the audio
-                            status.update(label=f"Transcribing audio using {api_choice} API...", state="running")
-                            try:
-                                if api_choice == "OpenAI":
-                                    st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_openai(
-                                        input_file, 
-                                        language=selected_language
-                                    )
-                                elif api_choice == "Groq":
-                                    st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_groq(
-                                        input_file,
-                                        language=selected_language
-                                    )
-                                else:  # Fal
-                                    st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_fal(
-                                        input_file,
-                                        language=selected_language
-                                    )
-                                
-                                # Add to history
-                                video_id = get_tiktok_video_id(tiktok_url)
-                                video_title = f"TikTok: {video_id}"
-                                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-                                st.session_state.history.append((timestamp, video_title, st.session_state.transcript))
-                                # Keep only the last 10 items
-                                st.session_state.history = st.session_state.history[-10:]
-                                
-                                # Save to database
-                                try:
-                                    # Get duration if available
-                                    duration = None
-                                    try:
-                                        duration = get_audio_info(input_file)
-                                    except:
-                                        pass
-                                        
-                                    save_transcription(
-                                        source_name=video_title,
-                                        source_type="tiktok",
-                                        api_used=api_choice,
-                                        language=selected_language,
-                                        duration=duration,
-                                        transcript=st.session_state.transcript
-                                    )
-                                except Exception as db_error:
-                                    st.warning(f"Failed to save to history database: {str(db_error)}")
-                                
-                                status.update(label=f"Transcription complete! Time taken: {st.session_state.transcription_time:.2f} seconds", state="complete")
-                            except Exception as e:
-                                error_msg = str(e)
-                                st.error(f"Transcription failed: {error_msg}")
-                                status.update(label="Transcription failed.", state="error")
-                                
-                            # Cleanup
-                            if os.path.exists(audio_file):
-                                os.unlink(audio_file)
-                            if 'input_file' in locals() and input_file != audio_file and os.path.exists(input_file):
-                                os.unlink(input_file)
-                                
-                        except Exception as e:
-                            st.error(f"Failed to process TikTok video: {str(e)}")
-                            status.update(label="Failed to process TikTok video.", state="error")
+                        transcribe_online_video(
+                            status, tiktok_url, "TikTok",
+                            video_title=f"TikTok: {video_id}",
+                            download_name=f"tiktok_{video_id or 'video'}",
+                            download=download_tiktok_audio,
+                            download_direct=download_tiktok_audio_direct,
+                            api_choice=api_choice,
+                            language=selected_language
+                        )
 
             if uploaded_file is not None:
                 # Determine if the file is a video
@@ -1139,131 +1917,69 @@ def main():
                     process_button = st.button("🔊 Transcribe Media", use_container_width=True)
                 
                 if process_button:
-                    with st.status("Processing media...", expanded=True) as status:
+                    # Intermediates live in a temporary directory that is removed however the block exits
+                    with st.status("Processing media...", expanded=True) as status, tempfile.TemporaryDirectory() as temp_dir:
                         # Save uploaded file temporarily
-                        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1])
-                        temp_input.write(uploaded_file.getvalue())
-                        temp_input.close()
+                        temp_input_path = os.path.join(temp_dir, 'input' + os.path.splitext(uploaded_file.name)[1])
+                        # Copy in 1MB chunks rather than materializing the whole upload as one bytes object
+                        uploaded_file.seek(0)
+                        with open(temp_input_path, 'wb') as temp_input:
+                            shutil.copyfileobj(uploaded_file, temp_input, length=1 << 20)
 
-                        file_size = os.path.getsize(temp_input.name) / (1024 * 1024)  # File size in MB
+                        file_size = os.stat(temp_input_path).st_size / (1024 * 1024)  # File size in MB
                         status.update(label=f"Input file size: {file_size:.2f} MB", state="running")
                         
-                        # Process video if needed
+                        # Videos have their audio track copied out, or re-encoded in one FFmpeg pass into memory
+                        duration = None
+                        transcribe = transcribe_audio
                         if is_video:
-                            status.update(label="Extracting audio from video...", state="running")
+                            status.update(label="Extracting audio...", state="running")
                             try:
-                                audio_file = extract_audio_from_video(temp_input.name)
-                                status.update(label="Audio extraction complete.", state="running")
+                                input_file, duration = prepare_audio_stream(temp_input_path, target_size=(upload_limit_mb(api_choice) - 0.1) * 1024)
+                                status.update(label="Audio preparation complete.", state="running")
                             except Exception as e:
-                                st.error(f"Failed to extract audio from video: {str(e)}")
-                                status.update(label="Failed to extract audio from video.", state="error")
-                                # Cleanup
-                                if os.path.exists(temp_input.name):
-                                    os.unlink(temp_input.name)
+                                st.error(f"Failed to prepare audio: {str(e)}")
+                                status.update(label="Failed to prepare audio.", state="error")
                                 st.stop()
-                        else:
-                            audio_file = temp_input.name
-
-                        # Check if compression is needed
-                        audio_file_size = os.path.getsize(audio_file) / (1024 * 1024)  # Audio file size in MB
-                        if audio_file_size > 25:
-                            status.update(label="File size exceeds 25MB. Compressing...", state="running")
-                            input_file = compress_audio(audio_file)
-                            status.update(label="Compression complete.", state="running")
+                        elif file_size > upload_limit_mb(api_choice):
+                            # Oversized audio is split into segments that are transcribed in parallel
+                            status.update(label=f"File size exceeds {upload_limit_mb(api_choice)}MB. Transcribing in parallel segments.", state="running")
+                            input_file = temp_input_path
+                            transcribe = transcribe_long
                         else:
                             status.update(label="File size is within the allowed limit. No compression needed.", state="running")
-                            input_file = audio_file
+                            input_file = temp_input_path
 
                         status.update(label=f"Transcribing audio using {api_choice} API...", state="running")
                         try:
-                            if api_choice == "OpenAI":
-                                st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_openai(
-                                    input_file, 
-                                    language=selected_language
-                                )
-                            elif api_choice == "Groq":
-                                st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_groq(
-                                    input_file,
-                                    language=selected_language
-                                )
-                            else:  # Fal
-                                st.session_state.transcript, st.session_state.transcription_time = transcribe_audio_fal(
-                                    input_file,
-                                    language=selected_language
-                                )
+                            results, errors, st.session_state.transcription_time, content_hash = run_with_progress(
+                                status,
+                                f"Transcribing audio using {api_choice} API...",
+                                transcribe_selected,
+                                api_choice,
+                                input_file,
+                                language=selected_language,
+                                transcribe=transcribe
+                            )
+                            show_transcription_results(results, errors)
                             
-                            # Add to history
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-                            st.session_state.history.append((timestamp, uploaded_file.name, st.session_state.transcript))
-                            # Keep only the last 10 items
-                            st.session_state.history = st.session_state.history[-10:]
-                            
-                            # Save to database
+                            # Save to database, probing the duration if video extraction didn't already
+                            if duration is None:
+                                duration = try_get_audio_info(temp_input_path)
                             try:
-                                # Get duration if available
-                                duration = None
-                                try:
-                                    duration = get_audio_info(input_file)
-                                except:
-                                    pass
-                                    
-                                save_transcription(
-                                    source_name=uploaded_file.name,
-                                    source_type="local",
-                                    api_used=api_choice,
-                                    language=selected_language,
-                                    duration=duration,
-                                    transcript=st.session_state.transcript
-                                )
+                                # One row per API result, written in a single transaction; wait so a failed save is reported
+                                wait_for_write(save_transcriptions_bulk(
+                                    [(uploaded_file.name, "local", api_used, selected_language, duration, transcript) for api_used, transcript in results.items()],
+                                    content_hash=content_hash
+                                ))
                             except Exception as db_error:
-                                st.warning(f"Failed to save to history database: {str(db_error)}")
+                                st.error(f"Failed to save to history database: {str(db_error)}")
                             
                             status.update(label=f"Transcription complete! Time taken: {st.session_state.transcription_time:.2f} seconds", state="complete")
                         except Exception as e:
                             error_msg = str(e)
                             st.error(f"Transcription failed: {error_msg}")
-                            
-                            if "proxies" in error_msg.lower() or "proxy" in error_msg.lower():
-                                st.error("""
-                                Proxy configuration issue detected! Try one of these solutions:
-                                
-                                1. Run the application without proxy environment variables:
-                                   ```
-                                   env -u HTTP_PROXY -u HTTPS_PROXY -u http_proxy -u https_proxy streamlit run whisper_webui.py
-                                   ```
-                                   
-                                2. Update your packages:
-                                   ```
-                                   pip install -U openai httpx
-                                   ```
-                                   
-                                3. Restart the application after clearing environment variables.
-                                """)
-                            elif "api key" in error_msg.lower():
-                                st.error("Please check that your API key is correct and has been entered properly.")
-                            elif "rate limit" in error_msg.lower() or "quota" in error_msg.lower():
-                                st.error("You may have hit a rate limit or quota on your API key. Please check your usage.")
-                            elif "network" in error_msg.lower() or "connection" in error_msg.lower() or "timeout" in error_msg.lower():
-                                st.error("Network error detected. Please check your internet connection.")
-                            elif "file" in error_msg.lower() and ("not found" in error_msg.lower() or "access" in error_msg.lower()):
-                                st.error("File access error. The temporary file may have been deleted or is inaccessible.")
-                            elif "format" in error_msg.lower() or "codec" in error_msg.lower():
-                                st.error("Audio format error. The file may be corrupted or in an unsupported format.")
-                            elif "ffmpeg" in error_msg.lower():
-                                st.error("FFmpeg error. Please ensure FFmpeg is properly installed on your system.")
-                            elif "memory" in error_msg.lower():
-                                st.error("Memory error. The file may be too large to process with available memory.")
-
-                        # Cleanup temporary files
-                        try:
-                            if os.path.exists(temp_input.name):
-                                os.unlink(temp_input.name)
-                            if is_video and os.path.exists(audio_file) and audio_file != input_file:
-                                os.unlink(audio_file)
-                            if audio_file_size > 25 and os.path.exists(input_file) and input_file != audio_file:
-                                os.unlink(input_file)
-                        except Exception as e:
-                            st.warning(f"Warning: Could not clean up temporary files: {str(e)}")
+                            show_error_hint(error_msg)
     
     with tab2:
         # Edit transcript
@@ -1274,6 +1990,16 @@ def main():
                 value=st.session_state.transcript, 
                 height=400
             )
+            
+            # Side-by-side results from a compare run
+            if st.session_state.comparison:
+                st.subheader("Compare APIs")
+                for api, transcript in st.session_state.comparison.items():
+                    with st.expander(api):
+                        st.write(transcript)
+                        if st.button(f"Use {api} transcript", key=f"use_{api}"):
+                            st.session_state.transcript = transcript
+                            st.rerun()
         else:
             st.info("No transcript available. Please upload and transcribe an audio file first.")
     
@@ -1285,8 +2011,8 @@ def main():
             # Copy to clipboard button
             if st.button("📋 Copy to Clipboard", use_container_width=True):
                 try:
-                    pyperclip.copy(st.session_state.transcript)
-                    st.markdown('<div class="success-message">✅ Transcript copied to clipboard!</div>', unsafe_allow_html=True)
+                    copy_to_clipboard(st.session_state.transcript)
+                    st.markdown(SUCCESS_MESSAGE_HTML.substitute(msg="Transcript copied to clipboard!"), unsafe_allow_html=True)
                 except Exception as e:
                     st.error(f"Failed to copy to clipboard: {str(e)}")
             
@@ -1306,7 +2032,7 @@ def main():
                         output_filename = f"{output_filename}.{file_format}"
                     
                     if save_transcript_to_file(st.session_state.transcript, output_filename):
-                        st.markdown(f'<div class="success-message">✅ Transcript saved to {output_filename}</div>', unsafe_allow_html=True)
+                        st.markdown(SUCCESS_MESSAGE_HTML.substitute(msg=f"Transcript saved to {output_filename}"), unsafe_allow_html=True)
                 else:
                     st.warning("Please enter a filename to save the transcript.")
         else:
@@ -1325,12 +2051,25 @@ def main():
             st.write("")
             show_favorites_only = st.checkbox("Favorites only")
         
-        # Get transcription history from database
-        history = get_transcription_history(limit=100, search_term=search_term if search_term else None)
+        # Get one page of transcription history from the database
+        page = st.session_state.get("history_page", 1)
+        history_filters = dict(search_term=search_term if search_term else None, favorites_only=show_favorites_only)
+        history = cached_history(
+            limit=HISTORY_PAGE_SIZE, offset=(page - 1) * HISTORY_PAGE_SIZE, **history_filters
+        )
+        if not history and page > 1:
+            # The page ran past the end, e.g. after a delete or a narrower search
+            st.session_state.history_page = page = 1
+            history = cached_history(limit=HISTORY_PAGE_SIZE, **history_filters)
         
         if not history:
             st.info("No transcription history found in the database.")
         else:
+            # Every row carries the total match count from the window function
+            total = history[0][-1]
+            first = (page - 1) * HISTORY_PAGE_SIZE + 1
+            st.caption(f"Showing {first}-{first + len(history) - 1} of {total} transcriptions")
+            
             # Display history in a table
             col1, col2, col3, col4, col5 = st.columns([2, 2, 1, 1, 1])
             col1.subheader("Source")
@@ -1340,11 +2079,7 @@ def main():
             col5.subheader("Actions")
             
             for record in history:
-                id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite = record
-                
-                # Skip non-favorites if showing favorites only
-                if show_favorites_only and not favorite:
-                    continue
+                id, timestamp, source_name, source_type, api_used, language, duration, transcript, favorite, _ = record
                 
                 with st.expander(f"{source_name} ({timestamp})"):
                     st.markdown(f"**Source:** {source_name}")
@@ -1367,24 +2102,32 @@ def main():
                     
                     with col2:
                         if st.button("Copy", key=f"copy_{id}"):
-                            pyperclip.copy(transcript)
+                            copy_to_clipboard(transcript)
                             st.success("Copied to clipboard!")
                     
                     with col3:
-                        if favorite:
-                            if st.button("Unfavorite", key=f"unfav_{id}"):
-                                toggle_favorite(id, False)
-                                st.rerun()
-                        else:
-                            if st.button("Favorite", key=f"fav_{id}"):
-                                toggle_favorite(id, True)
+                        label, key = ("Unfavorite", f"unfav_{id}") if favorite else ("Favorite", f"fav_{id}")
+                        if st.button(label, key=key):
+                            try:
+                                wait_for_write(toggle_favorite(id, not favorite))  # Wait for the writer so the rerun shows the change
+                            except Exception as e:
+                                st.error(f"Failed to update favorite: {str(e)}")
+                            else:
                                 st.rerun()
                     
                     with col4:
                         if st.button("Delete", key=f"del_{id}"):
-                            delete_transcription(id)
-                            st.success("Transcription deleted!")
-                            st.rerun()
+                            try:
+                                wait_for_write(delete_transcription(id))  # Wait for the writer so the rerun shows the change
+                            except Exception as e:
+                                st.error(f"Failed to delete transcription: {str(e)}")
+                            else:
+                                st.success("Transcription deleted!")
+                                st.rerun()
+            
+            page_count = math.ceil(total / HISTORY_PAGE_SIZE)
+            if page_count > 1:
+                st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1, key="history_page")
             
             # Export functionality
             st.subheader("Export History")